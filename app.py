@@ -4,25 +4,90 @@ Supports finding cases that cite or are cited by other cases,
 and surfaces citable passages with full provenance.
 """
 
+import asyncio
+import functools
 import json
+from concurrent.futures import ThreadPoolExecutor
 import gradio as gr
-from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
 from typing import List, Dict, Tuple
 import os
 from visualize import create_semantic_space_plot, create_citation_network_plot
+from citations import CitationResolver
+from quantized_index import load_quantized_index
+from exact_index import load_exact_index
+from onnx_encoder import encoder_id, load_encoder
+from snapshot import DEFAULT_SNAPSHOT_DIRECTORY, load_snapshot
+from prepare_data import INDEX_VERSION_FILE, citation_graph_from_csr
+from passage_citations import PASSAGE_CITATIONS_FILE, PassageCitationIndex, load_passage_citations
+from query_cache import (DEFAULT_QUERY_CACHE_SIZE, DEFAULT_RESULT_CACHE_BYTES, DEFAULT_RESULT_CACHE_TTL,
+                         QueryEmbeddingCache, ResultCache, file_version)
+from query_batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT_MS, MicroBatchEncoder
+
+# Initialize the embedding model ('onnx' runs it with onnxruntime instead of PyTorch)
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'torch')
+ONNX_QUANTIZED = os.environ.get('ONNX_QUANTIZED', '') == '1'
+print(f"Loading embedding model ({ENCODER_BACKEND} backend)...")
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+model = load_encoder(MODEL_NAME, ENCODER_BACKEND, quantized=ONNX_QUANTIZED)
+
+# Queries of concurrent requests are encoded together, in micro-batches (1 encodes each on its own)
+QUERY_BATCH_SIZE = int(os.environ.get('QUERY_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE))
+QUERY_BATCH_WAIT_MS = float(os.environ.get('QUERY_BATCH_WAIT_MS', DEFAULT_MAX_WAIT_MS))
+query_batcher = None
+if QUERY_BATCH_SIZE > 1:
+    query_batcher = MicroBatchEncoder(model, max_batch_size=QUERY_BATCH_SIZE, max_wait_ms=QUERY_BATCH_WAIT_MS)
+
+# Embeddings of recent queries (popular searches and the examples repeat often)
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', DEFAULT_QUERY_CACHE_SIZE))
+query_encoder = QueryEmbeddingCache(
+    query_batcher or model,
+    model_id=encoder_id(MODEL_NAME, ENCODER_BACKEND, ONNX_QUANTIZED),
+    max_size=QUERY_CACHE_SIZE
+)
+
+# Load the index snapshot (written by prepare_data.py --snapshot) if there is one;
+# it serves the same queries as the collection without opening ChromaDB
+SNAPSHOT_DIRECTORY = os.environ.get('SNAPSHOT_DIRECTORY', DEFAULT_SNAPSHOT_DIRECTORY)
+snapshot = load_snapshot(SNAPSHOT_DIRECTORY)
+
+# Vector search backend: 'quantized' (prepare_data.py --quantize, searched before the collection),
+# 'exact' (--exact-index, served in place of the collection), 'chroma' for the collection's own
+# index, or 'auto' for the quantized index if there is one
+SEARCH_BACKENDS = ('auto', 'chroma', 'quantized', 'exact')
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+if SEARCH_BACKEND not in SEARCH_BACKENDS:
+    raise ValueError(f"Unknown SEARCH_BACKEND: {SEARCH_BACKEND} (expected one of {SEARCH_BACKENDS})")
+# Read the exact index's matrix into memory rather than memory-mapping it
+EXACT_INDEX_IN_MEMORY = os.environ.get('EXACT_INDEX_IN_MEMORY', '') == '1'
 
-# Initialize the embedding model
-print("Loading embedding model...")
-model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-
-# Load ChromaDB
-print("Loading ChromaDB...")
 persist_directory = "./chromadb"
-if not os.path.exists(persist_directory):
-    print("ChromaDB not found. Please run prepare_data.py first!")
-else:
+client = None
+
+def open_collection():
+    """
+    Open what searches read passages from: the exact index with SEARCH_BACKEND=exact,
+    which needs no ChromaDB, or else the collection.
+
+    The collection is opened with a new ChromaDB client, so searches see writes made by other processes.
+    """
+    global client, collection
+    if SEARCH_BACKEND == 'exact':
+        exact_index = load_exact_index(os.path.join(persist_directory, 'exact_index'), EXACT_INDEX_IN_MEMORY)
+        if exact_index is not None:
+            collection = exact_index
+            print(f"✅ Loaded exact index with {len(exact_index)} passages "
+                  f"({exact_index.memory_bytes / 1e6:.1f} MB)")
+            return
+        print("Warning: exact index not found, searching the collection instead. "
+              "Please run prepare_data.py with --exact-index!")
+
+    print("Loading ChromaDB...")
+    if client is not None:
+        # The cached client keeps its vector index in memory, missing prepare_data.py's writes.
+        # Stopping it fails any query still running on the old handle.
+        client.clear_system_cache()
     client = chromadb.Client(Settings(
         anonymized_telemetry=False,
         persist_directory=persist_directory,
@@ -31,14 +96,116 @@ else:
     collection = client.get_collection("legal_cases")
     print(f"Loaded collection with {collection.count()} passages")
 
-# Load citation graph
-try:
-    with open('citation_graph.json', 'r') as f:
-        citation_graph = json.load(f)
-    print("✅ Loaded citation graph")
-except FileNotFoundError:
-    print("Warning: Citation graph not found. Please run prepare_data.py first!")
-    citation_graph = {}
+if snapshot is not None:
+    collection = snapshot
+    print(f"✅ Loaded snapshot with {collection.count()} passages from {SNAPSHOT_DIRECTORY}")
+elif not os.path.exists(persist_directory):
+    print("ChromaDB not found. Please run prepare_data.py first!")
+else:
+    open_collection()
+
+def load_index_data():
+    """Load the quantized index and citation data next to the collection (again, once they change)."""
+    global vector_index, citation_graph, citation_resolver, passage_citations
+
+    # Load the vector index selected by SEARCH_BACKEND
+    vector_index = None
+    if snapshot is not None:
+        # The snapshot searches its own embeddings exactly; the side indexes next to
+        # the collection may come from a different version of the index
+        if SEARCH_BACKEND in ('quantized', 'exact'):
+            print(f"Warning: SEARCH_BACKEND={SEARCH_BACKEND} is ignored when serving a snapshot, "
+                  "which is searched exactly")
+    elif SEARCH_BACKEND in ('auto', 'quantized'):
+        vector_index = load_quantized_index(os.path.join(persist_directory, 'quantized_index'))
+        if vector_index is not None:
+            print(f"✅ Loaded {vector_index.dtype} quantized index "
+                  f"({vector_index.memory_bytes / 1e6:.1f} MB in memory)")
+        elif SEARCH_BACKEND == 'quantized':
+            print("Warning: quantized index not found, searching the collection instead. "
+                  "Please run prepare_data.py with --quantize!")
+
+    # Load citation graph
+    if snapshot is not None:
+        citation_graph = citation_graph_from_csr(snapshot.citation_csr)
+        print("✅ Loaded citation graph from snapshot")
+    else:
+        try:
+            with open('citation_graph.json', 'r') as f:
+                citation_graph = json.load(f)
+            print("✅ Loaded citation graph")
+        except FileNotFoundError:
+            print("Warning: Citation graph not found. Please run prepare_data.py first!")
+            citation_graph = {}
+
+    # Load citation resolver (maps citation variants and parallel cites to case IDs)
+    if snapshot is not None:
+        citation_resolver = snapshot.resolver
+        print(f"✅ Loaded citation index with {len(citation_resolver.lookup)} citations from snapshot")
+    else:
+        try:
+            citation_resolver = CitationResolver.load('citation_index.json')
+            print(f"✅ Loaded citation index with {len(citation_resolver.lookup)} citations")
+        except FileNotFoundError:
+            print("Warning: Citation index not found. Please run prepare_data.py first!")
+            citation_resolver = CitationResolver()
+
+    # Load passage citations (chunk -> cited cases, and the passages citing each case)
+    if snapshot is not None:
+        passage_citations = snapshot.passage_citations
+    else:
+        passage_citations = load_passage_citations(os.path.join(persist_directory, PASSAGE_CITATIONS_FILE))
+    if passage_citations is not None:
+        print(f"✅ Loaded citations of {len(passage_citations)} passages")
+    else:
+        print("Warning: Passage citations not found. Please run prepare_data.py first!")
+        passage_citations = PassageCitationIndex([], [0], [], [])
+
+load_index_data()
+
+def index_version() -> Tuple:
+    """Version stamp of everything search results are computed from."""
+    if snapshot is not None:
+        return file_version([os.path.join(SNAPSHOT_DIRECTORY, 'manifest.json')])
+    # prepare_data.py stamps it once per run, after writing everything else. Not chroma.sqlite3,
+    # whose mtime changes whenever a client opens it (and on every ingestion batch)
+    return file_version([os.path.join(persist_directory, INDEX_VERSION_FILE)])
+
+def reload_index():
+    """Reopen the collection (or snapshot) and the index files after prepare_data.py rewrote them."""
+    global snapshot, collection
+    print("Index changed on disk, reloading...")
+    if snapshot is not None:
+        snapshot = collection = load_snapshot(SNAPSHOT_DIRECTORY) or snapshot
+    elif os.path.exists(persist_directory):
+        open_collection()
+    load_index_data()
+
+# Dedicated pools, so a slow job of one kind never holds up another: query encoding (mostly
+# waiting on the micro-batcher), vector queries and rendering, citation lookups, and plots.
+# Plots use threads, not processes: t-SNE and numpy release the GIL, while a spawned process
+# would re-import this module and load its own copy of the model.
+ENCODE_THREADS = int(os.environ.get('ENCODE_THREADS', max(QUERY_BATCH_SIZE, 1)))
+SEARCH_THREADS = int(os.environ.get('SEARCH_THREADS', 4))
+CITATION_THREADS = int(os.environ.get('CITATION_THREADS', 2))
+VISUALIZE_THREADS = int(os.environ.get('VISUALIZE_THREADS', 2))
+encode_executor = ThreadPoolExecutor(ENCODE_THREADS, thread_name_prefix='encode')
+search_executor = ThreadPoolExecutor(SEARCH_THREADS, thread_name_prefix='search')
+citation_executor = ThreadPoolExecutor(CITATION_THREADS, thread_name_prefix='citation')
+visualize_executor = ThreadPoolExecutor(VISUALIZE_THREADS, thread_name_prefix='visualize')
+
+# Events of each kind Gradio runs at once; each kind has its own queue slots
+CONCURRENCY_LIMITS = {
+    'search': int(os.environ.get('SEARCH_CONCURRENCY', 32)),
+    'citation': int(os.environ.get('CITATION_CONCURRENCY', 32)),
+    'visualize': int(os.environ.get('VISUALIZE_CONCURRENCY', 1)),
+}
+
+# Finished results of recent searches, dropped whenever the index changes
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', DEFAULT_RESULT_CACHE_TTL))
+RESULT_CACHE_MB = float(os.environ.get('RESULT_CACHE_MB', DEFAULT_RESULT_CACHE_BYTES / 2 ** 20))
+result_cache = ResultCache(index_version, ttl=RESULT_CACHE_TTL, max_bytes=int(RESULT_CACHE_MB * 2 ** 20),
+                           on_change=reload_index)
 
 def semantic_search(query: str, n_results: int = 5) -> List[Dict]:
     """
@@ -51,27 +218,54 @@ def semantic_search(query: str, n_results: int = 5) -> List[Dict]:
     Returns:
         List of search results with metadata
     """
-    query_embedding = model.encode([query])
-    results = collection.query(
-        query_embeddings=query_embedding.tolist(),
-        n_results=n_results
-    )
+    return search_by_embedding(query_encoder.encode(query), n_results)
+
+def search_by_embedding(query_embedding, n_results: int = 5) -> List[Dict]:
+    """Semantic search for an already encoded query; see semantic_search()."""
+    if vector_index is not None:
+        results = index_search(query_embedding, n_results)
+    else:
+        results = collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=n_results
+        )
 
     formatted_results = []
     for i in range(len(results['documents'][0])):
         metadata = results['metadatas'][0][i]
+        chunk_id = results['ids'][0][i]
         formatted_results.append({
             'text': results['documents'][0][i],
             'case_name': metadata['case_name'],
             'case_id': metadata['case_id'],
             'chunk_index': metadata['chunk_index'],
             'position_pct': metadata['position_pct'],
-            'citations': json.loads(metadata['citations']),
+            'citations': passage_citations.citations_of(chunk_id),
             'distance': results['distances'][0][i] if 'distances' in results else None
         })
 
     return formatted_results
 
+def index_search(query_embedding, n_results: int) -> Dict:
+    """
+    Search the quantized vector index and fetch the passages from the collection.
+
+    Returns:
+        Results shaped like collection.query() output for a single query
+    """
+    ids, distances = vector_index.search(query_embedding, n_results)
+    fetched = collection.get(ids=ids, include=['documents', 'metadatas'])
+    by_id = {cid: (document, metadata) for cid, document, metadata
+             in zip(fetched['ids'], fetched['documents'], fetched['metadatas'])}
+    # Skip passages deleted since the index was built
+    hits = [(cid, by_id[cid], distance) for cid, distance in zip(ids, distances) if cid in by_id]
+    return {
+        'ids': [[cid for cid, _, _ in hits]],
+        'documents': [[document for _, (document, _), _ in hits]],
+        'metadatas': [[metadata for _, (_, metadata), _ in hits]],
+        'distances': [[distance for _, _, distance in hits]]
+    }
+
 def find_citing_cases(case_id: str) -> List[Dict]:
     """Find all cases that cite the given case."""
     if case_id not in citation_graph:
@@ -88,6 +282,10 @@ def find_cited_cases(case_id: str) -> List[Dict]:
     cited_cases = citation_graph[case_id].get('cites', [])
     return cited_cases
 
+def find_citing_passages(case_id: str) -> List[str]:
+    """Find the IDs of all passages that cite the given case."""
+    return passage_citations.passages_citing(case_id, citation_resolver)
+
 def format_result_with_provenance(result: Dict, rank: int) -> str:
     """Format a search result with full provenance information."""
     output = f"### Result {rank}\n\n"
@@ -117,45 +315,73 @@ def format_result_with_provenance(result: Dict, rank: int) -> str:
     output += "---\n\n"
     return output
 
-def search_interface(query: str, num_results: int = 5) -> str:
-    """Main search interface function."""
-    if not query.strip():
-        return "Warning: Please enter a search query."
+def search_page(query: str, results: List[Dict]) -> Dict:
+    """
+    Render search results.
 
-    try:
-        results = semantic_search(query, n_results=num_results)
+    Returns:
+        {'results': the semantic_search() results, 'markdown': the rendered page}
+    """
+    if not results:
+        return {'results': results, 'markdown': "No results found."}
 
-        if not results:
-            return "No results found."
+    output = f"# Search Results for: \"{query}\"\n\n"
+    output += f"Found {len(results)} relevant passages:\n\n"
+    output += "---\n\n"
+
+    for i, result in enumerate(results, 1):
+        output += format_result_with_provenance(result, i)
 
-        output = f"# Search Results for: \"{query}\"\n\n"
-        output += f"Found {len(results)} relevant passages:\n\n"
-        output += "---\n\n"
+    return {'results': results, 'markdown': output}
 
-        for i, result in enumerate(results, 1):
-            output += format_result_with_provenance(result, i)
+async def run_in_pool(executor, fn, *args):
+    """Run a blocking call on one of the dedicated pools, keeping the event loop free."""
+    return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(fn, *args))
+
+async def search_interface(query: str, num_results: int = 5) -> str:
+    """Main search interface function."""
+    if not query.strip():
+        return "Warning: Please enter a search query."
 
-        return output
+    try:
+        num_results = int(num_results)
+        key = ('search', query, num_results)
+        # The lookup may reload the index after a rebuild, so it runs off the event loop too
+        page = await run_in_pool(search_executor, result_cache.get, key)
+        if page is None:
+            version = result_cache.version
+            query_embedding = await run_in_pool(encode_executor, query_encoder.encode, query)
+            page = await run_in_pool(search_executor, lambda: search_page(
+                query, search_by_embedding(query_embedding, num_results)))
+            result_cache.put(key, page, version)
+        return page['markdown']
 
     except Exception as e:
         return f"Error: {str(e)}\n\nPlease make sure you've run prepare_data.py first!"
 
-def citation_search_interface(case_name: str) -> str:
-    """Search for cases by citation relationships."""
-    if not case_name.strip():
-        return "Warning: Please enter a case name or ID."
+def citation_page(case_name: str) -> Dict:
+    """
+    Look up a case's citation relationships and render them.
 
-    # Try to find case ID from name
-    case_id = None
-    for cid in citation_graph.keys():
-        if case_name.lower() in cid.lower():
-            case_id = cid
-            break
+    Returns:
+        {'case_id', 'cited', 'citing', 'passages', 'markdown'}; case_id is
+        None (and the page lists the available cases) if nothing matched
+    """
+    # Try the input as a citation first ("347 US 483", "74 S. Ct. 686")
+    case_id = citation_resolver.resolve(case_name.strip())
+    if case_id not in citation_graph:
+        # Try to find case ID from name
+        case_id = None
+        for cid in citation_graph.keys():
+            if case_name.lower() in cid.lower():
+                case_id = cid
+                break
 
     if not case_id:
-        return f"Error: Case not found: {case_name}\n\nAvailable cases:\n" + "\n".join(
+        output = f"Error: Case not found: {case_name}\n\nAvailable cases:\n" + "\n".join(
             [f"- {cid}" for cid in citation_graph.keys()]
         )
+        return {'case_id': None, 'cited': [], 'citing': [], 'passages': [], 'markdown': output}
 
     output = f"# Citation Analysis for: {case_id}\n\n"
 
@@ -179,7 +405,34 @@ def citation_search_interface(case_name: str) -> str:
     else:
         output += "- None found\n"
 
-    return output
+    output += "\n"
+
+    # Passages that cite this case
+    passages = find_citing_passages(case_id)
+    output += f"## Passages citing this case ({len(passages)} passages):\n\n"
+    if passages:
+        for cid in passages:
+            output += f"- {cid}\n"
+    else:
+        output += "- None found\n"
+
+    return {'case_id': case_id, 'cited': cited, 'citing': citing, 'passages': passages, 'markdown': output}
+
+async def citation_search_interface(case_name: str) -> str:
+    """Search for cases by citation relationships."""
+    if not case_name.strip():
+        return "Warning: Please enter a case name or ID."
+
+    page = await run_in_pool(citation_executor, result_cache.get_or_compute, ('citations', case_name),
+                             lambda: citation_page(case_name))
+    return page['markdown']
+
+def server_stats() -> Dict:
+    """Counters of the query embedding cache, the result cache and query batching."""
+    stats = {'query_cache': query_encoder.stats(), 'result_cache': result_cache.stats()}
+    if query_batcher is not None:
+        stats['query_batching'] = query_batcher.stats()
+    return stats
 
 def get_case_context(case_id: str, position_pct: float, context_window: int = 3) -> str:
     """Get surrounding passages for context."""
@@ -247,7 +500,9 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         search_btn.click(
             fn=search_interface,
             inputs=[search_input, num_results],
-            outputs=search_output
+            outputs=search_output,
+            concurrency_limit=CONCURRENCY_LIMITS['search'],
+            concurrency_id='search'
         )
 
         # Example queries
@@ -266,8 +521,8 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         with gr.Row():
             with gr.Column():
                 citation_input = gr.Textbox(
-                    label="Case Name or ID",
-                    placeholder="e.g., brown_v_board_1954",
+                    label="Case Name, ID or Citation",
+                    placeholder="e.g., brown_v_board_1954 or 347 U.S. 483",
                     lines=1
                 )
                 citation_btn = gr.Button("Analyze Citations", variant="primary")
@@ -288,7 +543,9 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         citation_btn.click(
             fn=citation_search_interface,
             inputs=citation_input,
-            outputs=citation_output
+            outputs=citation_output,
+            concurrency_limit=CONCURRENCY_LIMITS['citation'],
+            concurrency_id='citation'
         )
 
         gr.Examples(
@@ -315,10 +572,12 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         semantic_plot = gr.Plot(label="Semantic Space")
         citation_network_plot = gr.Plot(label="Citation Network")
 
-        def generate_visualizations(method):
+        async def generate_visualizations(method):
             try:
-                semantic_fig = create_semantic_space_plot(method=method)
-                citation_fig = create_citation_network_plot()
+                semantic_fig, citation_fig = await asyncio.gather(
+                    run_in_pool(visualize_executor, create_semantic_space_plot, method),
+                    run_in_pool(visualize_executor, create_citation_network_plot)
+                )
                 return semantic_fig, citation_fig
             except Exception as e:
                 import plotly.graph_objects as go
@@ -333,7 +592,9 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         visualize_btn.click(
             fn=generate_visualizations,
             inputs=projection_method,
-            outputs=[semantic_plot, citation_network_plot]
+            outputs=[semantic_plot, citation_network_plot],
+            concurrency_limit=CONCURRENCY_LIMITS['visualize'],
+            concurrency_id='visualize'
         )
 
         gr.Markdown("""
@@ -344,5 +605,15 @@ with gr.Blocks(title="Semantic Legal Search with Citations") as demo:
         - Hover over points for details
         """)
 
+    with gr.Tab("Server Stats"):
+        gr.Markdown("### Cache hit rates, query batch sizes and queue waits since startup")
+        stats_btn = gr.Button("Refresh")
+        stats_output = gr.JSON(label="Stats")
+
+        stats_btn.click(fn=server_stats, inputs=None, outputs=stats_output)
+
+# Per-pool limits are set on each event above; anything else gets the default
+demo.queue(default_concurrency_limit=CONCURRENCY_LIMITS['citation'])
+
 if __name__ == "__main__":
     demo.launch(share=False)
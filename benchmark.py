@@ -0,0 +1,193 @@
+"""
+Ingestion benchmark suite over synthetic corpora.
+Measures chunking, citation extraction, citation graph build, encoding and storage throughput
+at increasing corpus sizes; a deterministic stub encoder lets it run offline.
+"""
+
+import json
+import shutil
+import tempfile
+import time
+import zlib
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from prepare_data import (CHUNKING_MODES, _case_metadata, build_citation_csr, build_citation_resolver,
+                          chunk_case, summarize_case_citations)
+from encoding import BucketedEncoder
+from collection_writer import PagedCollectionWriter
+from index_manifest import chunk_id
+from synthetic_corpus import SyntheticCorpus
+
+BENCHMARK_STAGES = ('generate', 'chunk', 'extract', 'graph', 'encode', 'store')
+
+class StubEncoder:
+    """
+    Deterministic stand-in for the sentence encoder.
+
+    Embeds a text as a signed hashed bag of its words, L2-normalized, so equal
+    texts get equal vectors and similar texts similar ones, with no model to
+    download. Implements the parts of the SentenceTransformer interface
+    BucketedEncoder uses.
+    """
+
+    def __init__(self, dim: int = 384, max_seq_length: int = 256):
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        self.tokenizer = None
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in text.lower().split()),
+                                 dtype=np.uint32)
+            signs = np.where(hashes & 1, 1.0, -1.0).astype(np.float32)
+            np.add.at(embeddings[row], (hashes >> 1) % self.dim, signs)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.clip(norms, 1e-12, None)
+
+def _load_benchmark_encoder(encoder: str):
+    if encoder == 'stub':
+        return StubEncoder()
+    from onnx_encoder import load_encoder
+    from prepare_data import MODEL_NAME
+    return load_encoder(MODEL_NAME, encoder)
+
+def run_benchmark(num_cases: int, encoder: str = 'stub', chunking: str = 'words',
+                  batch_size: int = 256, page_size: int = 1000, length_scale: float = 1.0,
+                  store_limit: Optional[int] = None, seed: int = 42) -> Dict[str, Dict]:
+    """
+    Ingest a synthetic corpus of num_cases cases, timing each stage separately.
+
+    Cases are generated and processed one at a time and chunks are encoded
+    and stored in batches, so memory stays flat at any corpus size; only the
+    citation summaries are kept, for the graph build. Storage goes to a
+    throwaway persistent ChromaDB collection.
+
+    Args:
+        num_cases: Corpus size
+        encoder: 'stub', or an encoder backend ('torch', 'onnx') for the real model
+        chunking: Chunking strategy, one of CHUNKING_MODES
+        batch_size: Chunks encoded and stored per batch
+        page_size: Chunks per collection write
+        length_scale: Multiplier on synthetic opinion lengths
+        store_limit: Stop encoding and storing after this many chunks
+        seed: Corpus seed
+
+    Returns:
+        Per stage: items processed, seconds and items per second
+    """
+    import chromadb
+    from chromadb.config import Settings
+
+    model = _load_benchmark_encoder(encoder)
+    bucketed = BucketedEncoder(model)
+    corpus = SyntheticCorpus(num_cases, seed=seed, length_scale=length_scale)
+
+    directory = tempfile.mkdtemp(prefix='semanticjury_bench_')
+    seconds = {stage: 0.0 for stage in BENCHMARK_STAGES}
+    items = {stage: 0 for stage in BENCHMARK_STAGES}
+    try:
+        client = chromadb.Client(Settings(anonymized_telemetry=False, persist_directory=directory,
+                                          is_persistent=True))
+        collection = client.create_collection("legal_cases")
+        writer = PagedCollectionWriter(collection, page_size=page_size,
+                                       max_batch_size=client.get_max_batch_size(), verbose=False)
+
+        def flush(chunks: List[Dict]):
+            began = time.perf_counter()
+            embeddings = bucketed.encode([chunk['text'] for chunk in chunks])
+            seconds['encode'] += time.perf_counter() - began
+            items['encode'] += len(chunks)
+
+            began = time.perf_counter()
+            writer.write(ids=[chunk_id(chunk) for chunk in chunks],
+                         documents=[chunk['text'] for chunk in chunks],
+                         metadatas=[_case_metadata(chunk) for chunk in chunks],
+                         embeddings=embeddings)
+            seconds['store'] += time.perf_counter() - began
+            items['store'] += len(chunks)
+
+        summaries, pending = [], []
+        cases = iter(corpus)
+        while True:
+            began = time.perf_counter()
+            case = next(cases, None)
+            seconds['generate'] += time.perf_counter() - began
+            if case is None:
+                break
+            items['generate'] += 1
+
+            began = time.perf_counter()
+            chunks = chunk_case(case, chunking)
+            seconds['chunk'] += time.perf_counter() - began
+            items['chunk'] += 1
+
+            began = time.perf_counter()
+            summaries.append(summarize_case_citations(case))
+            seconds['extract'] += time.perf_counter() - began
+            items['extract'] += 1
+
+            if store_limit is None or items['store'] + len(pending) < store_limit:
+                pending.extend(chunks)
+            if len(pending) >= batch_size:
+                flush(pending)
+                pending = []
+        if pending:
+            flush(pending)
+
+        began = time.perf_counter()
+        build_citation_csr(summaries, build_citation_resolver(summaries))
+        seconds['graph'] += time.perf_counter() - began
+        items['graph'] = len(summaries)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        stage: {
+            'items': items[stage],
+            'seconds': round(seconds[stage], 3),
+            'items_per_sec': round(items[stage] / max(seconds[stage], 1e-9), 1)
+        }
+        for stage in BENCHMARK_STAGES
+    }
+
+def print_results(num_cases: int, results: Dict[str, Dict]):
+    """Print one corpus size's results as a table."""
+    print(f"\n{num_cases} cases")
+    print(f"  {'stage':<10}{'items':>10}{'seconds':>10}{'items/sec':>12}")
+    for stage, stats in results.items():
+        unit = 'chunks' if stage in ('encode', 'store') else 'cases'
+        print(f"  {stage:<10}{stats['items']:>10}{stats['seconds']:>10.2f}{stats['items_per_sec']:>12.1f}  {unit}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion stages on synthetic corpora")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help="Corpus sizes to run, e.g. 1000 10000 100000 1000000")
+    parser.add_argument('--encoder', choices=('stub', 'torch', 'onnx'), default='stub')
+    parser.add_argument('--chunking', choices=CHUNKING_MODES, default='words')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--length-scale', type=float, default=1.0,
+                        help="Multiplier on synthetic opinion lengths (e.g. 0.1 for 10^6-case runs)")
+    parser.add_argument('--store-limit', type=int, default=None,
+                        help="Stop encoding and storing once this many chunks are queued, per size")
+    parser.add_argument('--output', default=None, help="Also write results as JSON")
+    args = parser.parse_args()
+
+    all_results = {}
+    for size in args.sizes:
+        results = run_benchmark(size, encoder=args.encoder, chunking=args.chunking,
+                                batch_size=args.batch_size, length_scale=args.length_scale,
+                                store_limit=args.store_limit)
+        print_results(size, results)
+        all_results[size] = results
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
@@ -0,0 +1,59 @@
+"""
+Append-only change log for large persisted maps.
+Checkpoints append only the keys that changed since the previous one, so their cost follows the
+size of the batch rather than of the corpus; the full map is rewritten once, when it is compacted.
+"""
+
+import json
+import os
+from typing import Any, Dict
+
+class ChangeLog:
+    """
+    JSONL log of [key, value] records replayed over a base snapshot of a map.
+
+    A null value records that the key was removed. Records are appended and
+    fsynced in one write per checkpoint; a record torn by a crash is cut off
+    when the log is next read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def replay(self, mapping: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the logged changes to mapping (in place) and return it."""
+        if not os.path.exists(self.path):
+            return mapping
+        valid_bytes = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    key, value = json.loads(line)
+                except ValueError:
+                    break
+                if value is None:
+                    mapping.pop(key, None)
+                else:
+                    mapping[key] = value
+                valid_bytes += len(line)
+        if valid_bytes != os.path.getsize(self.path):
+            # Later appends must start on a line of their own
+            os.truncate(self.path, valid_bytes)
+        return mapping
+
+    def append(self, changes: Dict[str, Any]):
+        """Durably append changes (a None value marks a removed key)."""
+        if not changes:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps([key, value]) + '\n' for key, value in changes.items()))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def clear(self):
+        """Drop the log once its changes are part of the base snapshot."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,50 @@
+"""
+Columnar (Parquet) table of stored passages.
+Holds each passage's ID, text and metadata in collection order, so indexes served from plain
+files (the snapshot, the exact index) return passages without opening ChromaDB. Requires pyarrow.
+"""
+
+from typing import List, Dict
+
+import numpy as np
+
+CHUNKS_FILE = 'chunks.parquet'
+
+# Metadata fields every chunk has, and those only some chunking modes record
+REQUIRED_FIELDS = ('case_id', 'case_name', 'chunk_index', 'position_pct', 'word_count')
+OPTIONAL_FIELDS = ('token_count', 'start_char', 'end_char')
+
+def chunk_schema():
+    import pyarrow as pa
+    return pa.schema([
+        ('id', pa.string()),
+        ('document', pa.string()),
+        ('case_id', pa.string()),
+        ('case_name', pa.string()),
+        ('chunk_index', pa.int32()),
+        ('position_pct', pa.float64()),
+        ('word_count', pa.int32()),
+        ('token_count', pa.int32()),
+        ('start_char', pa.int64()),
+        ('end_char', pa.int64()),
+    ])
+
+def page_table(page: Dict):
+    """Table of a page read with collection.get(include=['metadatas', 'documents', ...])."""
+    import pyarrow as pa
+    columns = {'id': page['ids'], 'document': page['documents']}
+    for field in REQUIRED_FIELDS + OPTIONAL_FIELDS:
+        columns[field] = [metadata.get(field) for metadata in page['metadatas']]
+    return pa.table(columns, schema=chunk_schema())
+
+def table_records(table, rows) -> List[Dict]:
+    """{'id', 'document', 'metadata'} of the given rows, with metadata shaped like the collection's."""
+    columns = table.take(np.asarray(rows, dtype=np.int64)).to_pydict()
+    records = []
+    for i in range(len(columns['id'])):
+        metadata = {field: columns[field][i] for field in REQUIRED_FIELDS}
+        for field in OPTIONAL_FIELDS:
+            if columns[field][i] is not None:
+                metadata[field] = columns[field][i]
+        records.append({'id': columns['id'][i], 'document': columns['document'][i], 'metadata': metadata})
+    return records
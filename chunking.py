@@ -0,0 +1,209 @@
+"""
+Alternative chunking strategies for legal opinions.
+The default word-window chunker lives in prepare_data.chunk_legal_document; the chunkers
+here size passages by what the embedding model actually sees, or cut them on sentence and
+paragraph boundaries.
+"""
+
+import bisect
+import re
+from functools import lru_cache
+from typing import List, Dict, Iterator, Tuple
+
+from citations import extract_citations, find_citations
+
+# all-MiniLM-L6-v2 truncates its input at 256 word-pieces, special tokens included
+DEFAULT_MAX_TOKENS = 256
+
+@lru_cache(maxsize=4)
+def get_tokenizer(model_name: str):
+    """Load (once per process) the fast tokenizer of an embedding model."""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name, use_fast=True)
+
+def chunk_legal_document_by_tokens(case_text: str, case_id: str, case_name: str, tokenizer,
+                                   max_tokens: int = DEFAULT_MAX_TOKENS,
+                                   overlap_tokens: int = 32) -> List[Dict]:
+    """
+    Chunk a legal document into passages that fill the encoder's token budget.
+
+    The opinion is tokenized once with the model's tokenizer; windows of up to
+    max_tokens (minus the special tokens the model adds) are cut on word
+    boundaries using the tokenizer's offsets, and each chunk's text is the
+    exact slice of the original opinion those tokens cover.
+
+    Args:
+        case_text: Full text of the legal case
+        case_id: Unique identifier for the case
+        case_name: Name of the case (e.g., "Brown v. Board of Education")
+        tokenizer: Fast (offset-mapping capable) tokenizer of the embedding model
+        max_tokens: Model's maximum sequence length, special tokens included
+        overlap_tokens: Number of tokens to overlap between chunks
+
+    Returns:
+        List of chunks with metadata, including each chunk's token_count
+    """
+    encoding = tokenizer(case_text, add_special_tokens=False, return_offsets_mapping=True,
+                         truncation=False, verbose=False)
+    offsets = encoding['offset_mapping']
+    word_ids = encoding.word_ids()
+    num_tokens = len(offsets)
+    budget = max(1, max_tokens - tokenizer.num_special_tokens_to_add())
+    overlap_tokens = min(overlap_tokens, budget // 2)
+
+    chunks = []
+    start = 0
+    while start < num_tokens:
+        end = min(start + budget, num_tokens)
+        # Back off to a word boundary unless the word alone overflows the window
+        boundary = end
+        while boundary < num_tokens and boundary > start and word_ids[boundary] == word_ids[boundary - 1]:
+            boundary -= 1
+        if boundary > start:
+            end = boundary
+
+        start_char, end_char = offsets[start][0], offsets[end - 1][1]
+        chunk_text = case_text[start_char:end_char]
+        token_count = end - start + tokenizer.num_special_tokens_to_add()
+
+        chunks.append({
+            'text': chunk_text,
+            'case_id': case_id,
+            'case_name': case_name,
+            'chunk_index': len(chunks),
+            'position_pct': round((start_char / len(case_text)) * 100, 2),
+            'citations': extract_citations(chunk_text),
+            'word_count': len(chunk_text.split()),
+            'token_count': token_count
+        })
+
+        if end >= num_tokens:
+            break
+        # Step back for overlap, again landing on a word boundary
+        next_start = max(end - overlap_tokens, start + 1)
+        while next_start > start + 1 and word_ids[next_start] == word_ids[next_start - 1]:
+            next_start -= 1
+        start = next_start
+
+    return chunks
+
+# Words ending in a period that do not end a sentence in legal prose
+ABBREVIATIONS = {
+    'v', 'vs', 'u.s', 'ct', 's', 'l', 'ed', 'f', 'supp', 'app', 'cir', 'cal', 'no', 'nos',
+    'inc', 'co', 'corp', 'ltd', 'mr', 'mrs', 'ms', 'dr', 'jr', 'sr', 'st', 'art', 'sec',
+    'id', 'e.g', 'i.e', 'cf', 'al', 'ann', 'stat', 'rev', 'const', 'amend', 'dist', 'div',
+    'gen', 'govt', 'dept', 'assn', 'bros', 'ch', 'cl', 'p', 'pp', 'para', 'n', 'nn',
+}
+
+# A paragraph break, or sentence-final punctuation (plus closing quotes/brackets)
+# followed by whitespace and the start of a new sentence
+BOUNDARY_PATTERN = re.compile(
+    r'(?P<paragraph>\n[ \t]*\n\s*)'
+    r'|(?P<sentence>[.!?]["\'”’)\]]*)\s+(?=["\'“‘(\[]?[A-Z])'
+)
+
+def _ends_with_abbreviation(text: str, period_index: int) -> bool:
+    """Whether the period at period_index closes an abbreviation like 'v.' or 'U.S.'."""
+    word_start = max(text.rfind(' ', 0, period_index), text.rfind('\n', 0, period_index)) + 1
+    word = text[word_start:period_index].lstrip('("\'“').lower()
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
+
+def sentence_spans(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """
+    Split text into sentences in a single regex pass, without copying it.
+
+    Yields:
+        (start_char, end_char, ends_paragraph) for each sentence; trailing
+        whitespace is excluded from the span
+    """
+    start = 0
+    for m in BOUNDARY_PATTERN.finditer(text):
+        if m.group('sentence') is not None:
+            if text[m.start()] == '.' and _ends_with_abbreviation(text, m.start()):
+                continue
+            end = m.end('sentence')
+            ends_paragraph = text.count('\n', end, m.end()) >= 2
+        else:
+            end = m.start()
+            ends_paragraph = True
+        if end > start:
+            yield start, end, ends_paragraph
+        start = m.end()
+    end = len(text.rstrip())
+    if end > start:
+        yield start, end, True
+
+def chunk_spans_by_sentences(text: str, chunk_size: int = 200,
+                             overlap_sentences: int = 1) -> List[Tuple[int, int]]:
+    """
+    Group sentences into chunk spans of up to chunk_size words.
+
+    Chunks end on sentence boundaries, and also at a paragraph break once they
+    are at least half full. A single sentence longer than chunk_size becomes a
+    chunk of its own.
+
+    Returns:
+        (start_char, end_char) span of each chunk in text
+    """
+    spans = []
+    current = []  # (start, end, word_count) of sentences in the open chunk
+    words = 0
+    for start, end, ends_paragraph in sentence_spans(text):
+        sentence_words = text.count(' ', start, end) + 1
+        if current and words + sentence_words > chunk_size:
+            spans.append((current[0][0], current[-1][1]))
+            current = current[-overlap_sentences:] if overlap_sentences else []
+            words = sum(count for _, _, count in current)
+            if current and words + sentence_words > chunk_size:
+                current, words = [], 0
+        current.append((start, end, sentence_words))
+        words += sentence_words
+        if ends_paragraph and words >= chunk_size // 2:
+            spans.append((current[0][0], current[-1][1]))
+            current, words = [], 0
+    if current:
+        spans.append((current[0][0], current[-1][1]))
+    return spans
+
+def chunk_legal_document_by_sentences(case_text: str, case_id: str, case_name: str,
+                                      chunk_size: int = 200,
+                                      overlap_sentences: int = 1) -> List[Dict]:
+    """
+    Chunk a legal document on sentence and paragraph boundaries.
+
+    Each chunk records its (start_char, end_char) span in the source opinion;
+    its text is that exact slice, original whitespace included, and
+    position_pct is derived from the span. Citations are found once over the
+    whole opinion and assigned to chunks by span.
+
+    Args:
+        case_text: Full text of the legal case
+        case_id: Unique identifier for the case
+        case_name: Name of the case (e.g., "Brown v. Board of Education")
+        chunk_size: Maximum number of words per chunk
+        overlap_sentences: Number of sentences repeated at the start of the next chunk
+
+    Returns:
+        List of chunks with metadata
+    """
+    citation_matches = find_citations(case_text)
+    citation_starts = [match.start for match in citation_matches]
+
+    chunks = []
+    for start_char, end_char in chunk_spans_by_sentences(case_text, chunk_size, overlap_sentences):
+        first = bisect.bisect_left(citation_starts, start_char)
+        last = bisect.bisect_left(citation_starts, end_char)
+        chunk_text = case_text[start_char:end_char]
+        chunks.append({
+            'text': chunk_text,
+            'case_id': case_id,
+            'case_name': case_name,
+            'chunk_index': len(chunks),
+            'position_pct': round((start_char / len(case_text)) * 100, 2),
+            'citations': [match.citation for match in citation_matches[first:last]
+                          if match.end <= end_char],
+            'word_count': len(chunk_text.split()),
+            'start_char': start_char,
+            'end_char': end_char
+        })
+    return chunks
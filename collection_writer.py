@@ -0,0 +1,112 @@
+"""
+Paged bulk writes into ChromaDB.
+Streams encoder output into the collection in fixed-size pages with progress tracking,
+so large corpora never exceed the client's max batch size or hold the whole index in memory.
+"""
+
+import json
+import os
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+DEFAULT_PAGE_SIZE = 1000
+
+class PagedCollectionWriter:
+    """
+    Upserts chunks into a collection page by page.
+
+    Every chunk handed to the writer advances a running offset, which is
+    persisted after each page when a progress path is given. A later run over
+    the same chunk stream can resume from that offset: chunks below it are
+    dropped by skip_written() before they are ever encoded. Callers that drop
+    part of the stream before writing it (e.g. near-duplicates) write with
+    advance=False and move the offset past the whole batch with advance().
+    """
+
+    def __init__(self, collection, page_size: int = DEFAULT_PAGE_SIZE,
+                 max_batch_size: Optional[int] = None,
+                 progress_path: Optional[str] = None, resume: bool = False,
+                 offset: int = 0, verbose: bool = True):
+        """
+        Args:
+            collection: ChromaDB collection to write into
+            page_size: Number of chunks per upsert call
+            max_batch_size: Client's max batch size; page_size is capped to it
+            progress_path: JSON file recording the offset reached so far
+            resume: Start from the offset recorded in progress_path
+            offset: Position of the first chunk that will be handed to the writer,
+                when the caller replays the stream from a checkpoint
+            verbose: Print progress after every write
+        """
+        self.collection = collection
+        self.page_size = min(page_size, max_batch_size) if max_batch_size else page_size
+        self.progress_path = progress_path
+        self.offset = offset
+        self.resume_offset = offset
+        self.written = 0
+        self.verbose = verbose
+        self._started = time.perf_counter()
+
+        if resume and progress_path and os.path.exists(progress_path):
+            with open(progress_path, 'r') as f:
+                self.resume_offset = json.load(f)['offset']
+            print(f"Resuming writes from offset {self.resume_offset}")
+
+    def skip_written(self, items: List) -> List:
+        """
+        Drop the items a previous run already wrote, advancing the offset past them.
+
+        Returns:
+            The items that still need to be encoded and written
+        """
+        skip = min(max(self.resume_offset - self.offset, 0), len(items))
+        self.offset += skip
+        return items[skip:]
+
+    def write(self, ids: List[str], documents: List[str], metadatas: List[Dict],
+              embeddings: np.ndarray, advance: bool = True):
+        """
+        Upsert a batch of chunks, split into pages of at most page_size.
+
+        Args:
+            advance: Move the offset past each page as it is written; with False
+                the offset is left to a later advance() call
+        """
+        for start in range(0, len(ids), self.page_size):
+            end = start + self.page_size
+            self.collection.upsert(
+                ids=ids[start:end],
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=embeddings[start:end]
+            )
+            page_len = len(ids[start:end])
+            self.written += page_len
+            if advance:
+                self.advance(page_len)
+
+        if not self.verbose:
+            return
+        elapsed = time.perf_counter() - self._started
+        print(f"  Wrote {self.written} chunks (offset {self.offset}, "
+              f"{self.written / max(elapsed, 1e-9):.1f} chunks/sec)")
+
+    def advance(self, count: int):
+        """Move the offset past count items of the stream and persist it."""
+        self.offset += count
+        self._save_progress()
+
+    def _save_progress(self):
+        if not self.progress_path:
+            return
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'offset': self.offset}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def finish(self):
+        """Mark the stream as fully written, so the next run starts from zero."""
+        if self.progress_path and os.path.exists(self.progress_path):
+            os.remove(self.progress_path)
@@ -0,0 +1,210 @@
+"""
+Near-duplicate passage detection with MinHash and locality-sensitive hashing.
+Used by the ingestion pipeline to keep repeated boilerplate (syllabi, headnotes,
+reprinted statutes) from being embedded and stored more than once.
+"""
+
+import json
+import os
+import re
+import zlib
+from typing import List, Dict, Iterable, Optional
+
+import numpy as np
+
+from change_log import ChangeLog
+
+# Prime just below 2**32: (a * x + b) for a, b, x < 2**32 fits in uint64
+_PRIME = np.uint64(4294967291)
+
+_WORD_PATTERN = re.compile(r'\w+')
+
+class MinHasher:
+    """MinHash signatures of word shingle sets."""
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        """
+        Args:
+            num_perm: Number of hash permutations (signature length)
+            shingle_size: Number of consecutive words per shingle
+            seed: Seed of the permutation parameters
+        """
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.randint(1, int(_PRIME), size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_PRIME), size=num_perm, dtype=np.uint64)
+
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        """32-bit hashes of the distinct word shingles of a text."""
+        words = _WORD_PATTERN.findall(text.lower())
+        k = min(self.shingle_size, len(words)) or 1
+        shingles = {' '.join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                           dtype=np.uint64, count=len(shingles))
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature (num_perm uint32 values) of a text."""
+        hashes = self.shingle_hashes(text)
+        permuted = (hashes[:, None] * self._a + self._b) % _PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+class NearDuplicateFilter:
+    """
+    Streaming near-duplicate detector over chunk texts.
+
+    Signatures are split into bands; two chunks become candidates when any
+    band matches exactly, and a candidate counts as a duplicate when the
+    signatures agree on at least `threshold` of their positions (an estimate
+    of the Jaccard similarity of their shingle sets). The first chunk seen of
+    each group is kept as its canonical copy.
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, bands: int = 16,
+                 shingle_size: int = 5):
+        """
+        Args:
+            threshold: Minimum estimated Jaccard similarity of a near-duplicate
+            num_perm: MinHash signature length
+            bands: Number of LSH bands; num_perm must be divisible by it
+            shingle_size: Number of consecutive words per shingle
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self._tables = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def find_duplicate(self, cid: str, text: str) -> Optional[str]:
+        """
+        Check a chunk against every canonical chunk seen so far.
+
+        Returns:
+            ID of the canonical chunk it duplicates, or None if the chunk is
+            new (in which case it becomes canonical itself)
+        """
+        signature = self.hasher.signature(text)
+        keys = [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+        candidates = {self._tables[i][key] for i, key in enumerate(keys) if key in self._tables[i]}
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            return best
+
+        self._signatures[cid] = signature
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, cid)
+        return None
+
+    def filter(self, chunks: List[Dict], ids: List[str]) -> Dict[str, str]:
+        """
+        Find the near-duplicates in a list of chunks.
+
+        Returns:
+            Mapping from the ID of each near-duplicate chunk to its canonical chunk ID
+        """
+        duplicates = {}
+        for cid, chunk in zip(ids, chunks):
+            canonical = self.find_duplicate(cid, chunk['text'])
+            if canonical is not None:
+                duplicates[cid] = canonical
+        return duplicates
+
+class DuplicateLinks:
+    """
+    Near-duplicate chunk ID -> canonical chunk ID links, kept across runs.
+
+    Stored as a JSON object next to the collection, plus a change log
+    (duplicate_links.log.jsonl) of the links added or dropped since the JSON
+    was last compacted. The canonical -> near-duplicates inverse is built on
+    the first dependents() lookup and kept up to date from then on.
+
+    When a canonical chunk is deleted or rewritten, its near-duplicates are
+    released: linked to PENDING until they are stored or linked to another
+    canonical chunk, so they survive an interrupted run.
+    """
+
+    # Link target of released near-duplicates
+    PENDING = ''
+
+    def __init__(self, path: str, links: Optional[Dict[str, str]] = None):
+        self.path = path
+        self.links = links or {}
+        self._log = ChangeLog(os.path.splitext(path)[0] + '.log.jsonl')
+        # Links (None for dropped ones) not yet saved to the log
+        self._changes = {}
+        self._dependents = None
+
+    @classmethod
+    def load(cls, path: str) -> 'DuplicateLinks':
+        """Links of earlier runs, with their change log replayed."""
+        links = cls(path)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                links.links = json.load(f)
+        links._log.replay(links.links)
+        return links
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def __contains__(self, cid: str) -> bool:
+        return cid in self.links
+
+    def dependents(self, canonical: str) -> List[str]:
+        """IDs of the near-duplicates linked to a canonical chunk."""
+        if self._dependents is None:
+            self._dependents = {}
+            for cid, target in self.links.items():
+                self._dependents.setdefault(target, set()).add(cid)
+        return sorted(self._dependents.get(canonical, ()))
+
+    def pending(self) -> List[str]:
+        """IDs of the released near-duplicates, which no stored chunk represents."""
+        return self.dependents(self.PENDING)
+
+    def release(self, canonical_ids: Iterable[str]):
+        """Mark the near-duplicates of chunks that are deleted or rewritten as pending."""
+        self.update({dependent: self.PENDING for cid in canonical_ids if cid != self.PENDING
+                     for dependent in self.dependents(cid)})
+
+    def update(self, duplicates: Dict[str, str]):
+        """Link each near-duplicate chunk ID to its canonical chunk ID."""
+        for cid, canonical in duplicates.items():
+            self.discard(cid)
+            self.links[cid] = canonical
+            self._changes[cid] = canonical
+            if self._dependents is not None:
+                self._dependents.setdefault(canonical, set()).add(cid)
+
+    def discard(self, cid: str):
+        """Drop the link of a chunk, if it has one."""
+        if cid not in self.links:
+            return
+        canonical = self.links.pop(cid)
+        self._changes[cid] = None
+        if self._dependents is not None:
+            self._dependents[canonical].discard(cid)
+            if not self._dependents[canonical]:
+                del self._dependents[canonical]
+
+    def save(self):
+        """Durably append the links changed since the last save to the change log."""
+        self._log.append(self._changes)
+        self._changes = {}
+
+    def compact(self):
+        """Atomically rewrite all links next to the collection and clear the change log."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.links, f)
+        os.replace(tmp_path, self.path)
+        self._log.clear()
+        self._changes = {}
@@ -0,0 +1,430 @@
+"""
+Embedding generation utilities for the ingestion pipeline.
+Schedules chunk encoding so the sentence encoder spends its time on real tokens, not padding,
+and caches embeddings on disk so unchanged text is never encoded twice.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Upper token-length bound of each bucket; anything longer falls in the last bucket
+DEFAULT_BUCKET_EDGES = (32, 64, 128, 256)
+
+# Batch sizes tried per bucket while auto-tuning
+DEFAULT_BATCH_SIZES = (8, 16, 32, 64, 128)
+
+# Ceiling on padded tokens per batch (batch_size * bucket length), bounds activation memory
+DEFAULT_MAX_BATCH_TOKENS = 16384
+
+# Smallest slice of texts worth sending to an encoding worker
+MIN_TEXTS_PER_WORKER = 64
+
+class BucketedEncoder:
+    """
+    Length-bucketed, self-tuning batch scheduler around a SentenceTransformer.
+
+    Texts are measured in tokens, grouped into length buckets and encoded
+    bucket by bucket so each batch pads to a similar length. For every bucket
+    the candidate batch sizes that fit under the token ceiling are each timed
+    once, then the fastest is used for the rest of the run. Embeddings are
+    always returned in the order the texts were given.
+    """
+
+    def __init__(self, model, bucket_edges: Sequence[int] = DEFAULT_BUCKET_EDGES,
+                 batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS):
+        """
+        Args:
+            model: SentenceTransformer (or anything with a compatible encode())
+            bucket_edges: Ascending upper token-length bound of each bucket
+            batch_sizes: Candidate batch sizes to tune over
+            max_batch_tokens: Maximum padded tokens per batch
+        """
+        self.model = model
+        self.max_seq_length = getattr(model, 'max_seq_length', None) or max(bucket_edges)
+        self.bucket_edges = sorted(edge for edge in bucket_edges if edge < self.max_seq_length)
+        self.bucket_edges.append(self.max_seq_length)
+        self.batch_sizes = sorted(batch_sizes)
+        self.max_batch_tokens = max_batch_tokens
+
+        # Per bucket: measured chunks/sec of each batch size tried, and run totals
+        self._trials = {edge: {} for edge in self.bucket_edges}
+        self._stats = {edge: {'chunks': 0, 'seconds': 0.0, 'chunks_truncated': 0, 'tokens_truncated': 0}
+                       for edge in self.bucket_edges}
+
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """Full token count of each text, which may exceed the model's max sequence length."""
+        tokenizer = getattr(self.model, 'tokenizer', None)
+        if tokenizer is None:
+            # Rough word-piece estimate when the model exposes no tokenizer
+            return [int(len(text.split()) * 1.3) + 2 for text in texts]
+        encoded = tokenizer(texts, add_special_tokens=True, truncation=False, verbose=False)
+        return [len(ids) for ids in encoded['input_ids']]
+
+    def _bucket_for(self, length: int) -> int:
+        for edge in self.bucket_edges:
+            if length <= edge:
+                return edge
+        return self.bucket_edges[-1]
+
+    def _next_batch_size(self, edge: int) -> int:
+        """Untried candidate batch size for the bucket, or the fastest one measured."""
+        limit = max(1, self.max_batch_tokens // edge)
+        candidates = [size for size in self.batch_sizes if size <= limit] or [limit]
+        trials = self._trials[edge]
+        for size in candidates:
+            if size not in trials:
+                return size
+        return max(candidates, key=lambda size: trials[size])
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts, scheduling batches by token length.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            float32 array of shape (len(texts), dim), in input order
+        """
+        if not texts:
+            return np.zeros((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        lengths = self.token_lengths(texts)
+        # The model silently drops every token past max_seq_length; count what is lost
+        overflow = [length - self.max_seq_length for length in lengths if length > self.max_seq_length]
+        self._stats[self.max_seq_length]['chunks_truncated'] += len(overflow)
+        self._stats[self.max_seq_length]['tokens_truncated'] += sum(overflow)
+        order = sorted(range(len(texts)), key=lambda i: lengths[i])
+        buckets = {edge: [] for edge in self.bucket_edges}
+        for i in order:
+            buckets[self._bucket_for(lengths[i])].append(i)
+
+        embeddings = None
+        for edge, indices in buckets.items():
+            start = 0
+            while start < len(indices):
+                batch_size = self._next_batch_size(edge)
+                batch = indices[start:start + batch_size]
+                start += len(batch)
+
+                began = time.perf_counter()
+                batch_embeddings = self.model.encode(
+                    [texts[i] for i in batch],
+                    batch_size=len(batch),
+                    show_progress_bar=False,
+                    convert_to_numpy=True
+                )
+                elapsed = time.perf_counter() - began
+
+                # Only full batches are representative throughput samples
+                if len(batch) == batch_size and batch_size not in self._trials[edge]:
+                    self._trials[edge][batch_size] = len(batch) / max(elapsed, 1e-9)
+                self._stats[edge]['chunks'] += len(batch)
+                self._stats[edge]['seconds'] += elapsed
+
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), batch_embeddings.shape[1]), dtype=np.float32)
+                embeddings[batch] = batch_embeddings
+
+        return embeddings
+
+    def report(self) -> Dict[int, Dict]:
+        """
+        Throughput summary per bucket.
+
+        Returns:
+            Dictionary mapping bucket upper token length to chunks encoded,
+            seconds spent, chunks/sec, the tuned batch size, and how many
+            chunks (and tokens) the model truncated
+        """
+        report = {}
+        for edge, stats in self._stats.items():
+            if not stats['chunks']:
+                continue
+            trials = self._trials[edge]
+            report[edge] = {
+                'chunks': stats['chunks'],
+                'seconds': round(stats['seconds'], 3),
+                'chunks_per_sec': round(stats['chunks'] / max(stats['seconds'], 1e-9), 1),
+                'batch_size': max(trials, key=trials.get) if trials else None,
+                'chunks_truncated': stats['chunks_truncated'],
+                'tokens_truncated': stats['tokens_truncated']
+            }
+        return report
+
+    def print_report(self):
+        """Print per-bucket encoding throughput."""
+        _print_bucket_report(self.bucket_edges, self.report())
+
+def _print_bucket_report(bucket_edges: List[int], report: Dict[int, Dict]):
+    lower_bounds = dict(zip(bucket_edges, [0] + bucket_edges[:-1]))
+    for edge, stats in report.items():
+        print(f"  tokens {lower_bounds[edge] + 1:>3}-{edge:<3}: {stats['chunks']} chunks, "
+              f"{stats['chunks_per_sec']} chunks/sec (batch size {stats['batch_size']})")
+    chunks_truncated = sum(stats['chunks_truncated'] for stats in report.values())
+    if chunks_truncated:
+        tokens_truncated = sum(stats['tokens_truncated'] for stats in report.values())
+        print(f"  truncated: {chunks_truncated} chunks exceeded {bucket_edges[-1]} tokens, "
+              f"{tokens_truncated} tokens dropped by the encoder")
+
+# Encoder of the current EncoderPool worker process
+_worker_encoder = None
+
+def _init_encoder_worker(model_name: str, backend: str, threads: Optional[int], onnx_quantized: bool):
+    global _worker_encoder
+    if threads and backend == 'torch':
+        import torch
+        torch.set_num_threads(threads)
+    from onnx_encoder import load_encoder
+    model = load_encoder(model_name, backend, quantized=onnx_quantized, num_threads=threads)
+    _worker_encoder = BucketedEncoder(model)
+
+def _describe_worker_encoder() -> Tuple[int, List[int]]:
+    return _worker_encoder.model.get_sentence_embedding_dimension(), _worker_encoder.bucket_edges
+
+def _encode_in_worker(texts: List[str]) -> Tuple[np.ndarray, int, Dict[int, Dict]]:
+    return _worker_encoder.encode(texts), os.getpid(), _worker_encoder.report()
+
+class EncoderPool:
+    """
+    Pool of encoder processes with the BucketedEncoder.encode() interface.
+
+    Each call splits its texts into contiguous slices, one per worker (at
+    least MIN_TEXTS_PER_WORKER texts each), encodes them in parallel with a
+    BucketedEncoder per worker, and reassembles the embeddings in input
+    order. Workers are spawned rather than forked, so they never inherit the
+    parent's threads or loaded model.
+    """
+
+    def __init__(self, model_name: str, backend: str = 'torch', workers: int = 2,
+                 threads_per_worker: Optional[int] = None, onnx_quantized: bool = False):
+        """
+        Args:
+            model_name: SentenceTransformer model name
+            backend: Encoder backend of the workers, 'torch' or 'onnx'
+            workers: Number of encoding processes
+            threads_per_worker: torch (or onnxruntime) threads per process;
+                defaults to the library's own choice
+            onnx_quantized: Use the dynamically quantized ONNX model
+        """
+        if backend == 'onnx':
+            # Export once here rather than racing to export in every worker
+            from onnx_encoder import ensure_onnx_export
+            ensure_onnx_export(model_name, quantized=onnx_quantized)
+        self.workers = workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_encoder_worker,
+            initargs=(model_name, backend, threads_per_worker, onnx_quantized)
+        )
+        self._reports = {}
+        try:
+            self.dim, self.bucket_edges = self._executor.submit(_describe_worker_encoder).result()
+        except BaseException:
+            self.close()
+            raise
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Encode texts across the worker processes.
+
+        If a worker fails, pending slices are cancelled and the error is re-raised.
+
+        Returns:
+            float32 array of shape (len(texts), dim), in input order
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        num_slices = max(1, min(self.workers, len(texts) // MIN_TEXTS_PER_WORKER))
+        bounds = np.linspace(0, len(texts), num_slices + 1).astype(int)
+        futures = [self._executor.submit(_encode_in_worker, texts[start:end])
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        try:
+            for start, end, future in zip(bounds[:-1], bounds[1:], futures):
+                embeddings[start:end], pid, report = future.result()
+                self._reports[pid] = report
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        return embeddings
+
+    def report(self) -> Dict[int, Dict]:
+        """Per-bucket throughput summed over workers, shaped like BucketedEncoder.report()."""
+        merged = {}
+        for worker_report in self._reports.values():
+            for edge, stats in worker_report.items():
+                entry = merged.setdefault(edge, {'chunks': 0, 'seconds': 0.0, 'batch_size': stats['batch_size'],
+                                                 'chunks_truncated': 0, 'tokens_truncated': 0})
+                for key in ('chunks', 'seconds', 'chunks_truncated', 'tokens_truncated'):
+                    entry[key] += stats[key]
+        for entry in merged.values():
+            entry['chunks_per_sec'] = round(entry['chunks'] / max(entry['seconds'], 1e-9), 1)
+        return dict(sorted(merged.items()))
+
+    def print_report(self):
+        """Print per-bucket encoding throughput (per worker process)."""
+        _print_bucket_report(self.bucket_edges, self.report())
+
+    def close(self):
+        """Stop the workers, dropping slices that have not started."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> 'EncoderPool':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of chunk embeddings.
+
+    Vectors live in an append-only matrix file that is read back through a
+    memory map; a parallel file holds the SHA-1 digest of each row's text,
+    from which the digest -> row index is rebuilt on open. Each model gets its
+    own subdirectory, and the model name is recorded and checked on open, so
+    switching models (or backends, whose vectors differ slightly) never serves
+    another model's vectors.
+    """
+
+    DIGEST_SIZE = 20
+
+    def __init__(self, cache_directory: str, model_name: str, dim: int, dtype: str = 'float32'):
+        """
+        Args:
+            cache_directory: Root directory of the cache
+            model_name: Model (and backend) the embeddings come from, as given by
+                onnx_encoder.encoder_id()
+            dim: Embedding dimension
+            dtype: Storage dtype, 'float32' or 'float16'
+        """
+        self.model_name = model_name
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.directory = os.path.join(cache_directory, model_name.replace('/', '__').replace(':', '__'))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._vectors_path = os.path.join(self.directory, 'vectors.bin')
+        self._digests_path = os.path.join(self.directory, 'digests.bin')
+        self._check_meta()
+
+        self._index = {}
+        self._rows = 0
+        self._load_index()
+        self._mmap = None
+        self._mmap_rows = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _check_meta(self):
+        meta_path = os.path.join(self.directory, 'meta.json')
+        meta = {'model_name': self.model_name, 'dim': self.dim, 'dtype': self.dtype.name}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                existing = json.load(f)
+            if existing == meta:
+                return
+            print(f"Warning: embedding cache at {self.directory} was built with {existing}, resetting it")
+            for path in (self._vectors_path, self._digests_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+    def _load_index(self):
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_rows = os.path.getsize(self._vectors_path) // row_bytes if os.path.exists(self._vectors_path) else 0
+        digests = b''
+        if os.path.exists(self._digests_path):
+            with open(self._digests_path, 'rb') as f:
+                digests = f.read()
+        # A crash between the two appends can leave one file ahead (or a row half
+        # written), even before the first digest was; cut both back to the rows
+        # they share so later appends line up
+        rows = min(len(digests) // self.DIGEST_SIZE, vector_rows)
+        if os.path.exists(self._vectors_path) and os.path.getsize(self._vectors_path) != rows * row_bytes:
+            os.truncate(self._vectors_path, rows * row_bytes)
+        if os.path.exists(self._digests_path) and len(digests) != rows * self.DIGEST_SIZE:
+            os.truncate(self._digests_path, rows * self.DIGEST_SIZE)
+        for row in range(rows):
+            self._index[digests[row * self.DIGEST_SIZE:(row + 1) * self.DIGEST_SIZE]] = row
+        self._rows = rows
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def _matrix(self) -> np.ndarray:
+        if self._mmap is None or self._mmap_rows != self._rows:
+            self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode='r',
+                                   shape=(self._rows, self.dim))
+            self._mmap_rows = self._rows
+        return self._mmap
+
+    def lookup(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Look up cached embeddings.
+
+        Returns:
+            (float32 array with rows filled for cache hits, indices of the misses)
+        """
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        hit_positions, hit_rows, misses = [], [], []
+        for i, text in enumerate(texts):
+            row = self._index.get(self.digest(text))
+            if row is None:
+                misses.append(i)
+            else:
+                hit_positions.append(i)
+                hit_rows.append(row)
+        if hit_rows:
+            embeddings[hit_positions] = self._matrix()[hit_rows]
+        self.hits += len(hit_rows)
+        self.misses += len(misses)
+        return embeddings, misses
+
+    def add(self, texts: List[str], embeddings: np.ndarray):
+        """Append embeddings for texts that are not cached yet."""
+        new_digests, new_rows = [], []
+        for text, embedding in zip(texts, embeddings):
+            digest = self.digest(text)
+            if digest in self._index:
+                continue
+            self._index[digest] = self._rows + len(new_rows)
+            new_digests.append(digest)
+            new_rows.append(embedding)
+        if not new_rows:
+            return
+        with open(self._vectors_path, 'ab') as f:
+            f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+        with open(self._digests_path, 'ab') as f:
+            f.write(b''.join(new_digests))
+        self._rows += len(new_rows)
+
+def encode_with_cache(encoder, texts: List[str],
+                      cache: Optional[EmbeddingCache] = None) -> np.ndarray:
+    """
+    Encode texts, serving cached embeddings and encoding only the misses.
+
+    The encoder is a BucketedEncoder or an EncoderPool.
+    """
+    if cache is None:
+        return encoder.encode(texts)
+    embeddings, misses = cache.lookup(texts)
+    if misses:
+        miss_texts = [texts[i] for i in misses]
+        miss_embeddings = encoder.encode(miss_texts)
+        embeddings[misses] = miss_embeddings
+        cache.add(miss_texts, miss_embeddings)
+    return embeddings
@@ -0,0 +1,239 @@
+"""
+Exact in-memory vector index for passage search.
+Keeps every passage embedding in one contiguous float32 matrix (memory-mapped from disk) and
+answers queries with a single matrix product and argpartition, with no approximate-search recall loss.
+The passages themselves are stored alongside, so the app can serve it without opening ChromaDB.
+"""
+
+import json
+import os
+import shutil
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from chunk_table import CHUNKS_FILE, chunk_schema, page_table, table_records
+
+# Rows multiplied at a time when several queries are searched together, bounding scratch memory
+BLOCK_ROWS = 65536
+
+def exact_top_k(embeddings: np.ndarray, norms: np.ndarray, queries: np.ndarray,
+                n_results: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact nearest rows by squared L2 distance, the collection's default space.
+
+    Distances are expanded as |x|^2 - 2 x.q + |q|^2 with the squared norms
+    precomputed, so each query costs one matrix product over the embeddings.
+
+    Args:
+        embeddings: (N, dim) float32 matrix, in memory or memory-mapped
+        norms: Squared norm of each row
+        queries: (Q, dim) query embeddings
+        n_results: Results per query
+
+    Returns:
+        (rows, distances), each (Q, min(n_results, N)), nearest first
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, embeddings.shape[1])
+    n_results = min(n_results, len(embeddings))
+    if n_results == 0:
+        return np.zeros((len(queries), 0), dtype=np.int64), np.zeros((len(queries), 0), dtype=np.float32)
+
+    dots = np.empty((len(queries), len(embeddings)), dtype=np.float32)
+    for start in range(0, len(embeddings), BLOCK_ROWS):
+        dots[:, start:start + BLOCK_ROWS] = queries @ embeddings[start:start + BLOCK_ROWS].T
+    distances = norms[np.newaxis, :] - 2 * dots + np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+
+    if n_results < len(embeddings):
+        rows = np.argpartition(distances, n_results - 1, axis=1)[:, :n_results]
+    else:
+        rows = np.broadcast_to(np.arange(len(embeddings)), distances.shape)
+    top = np.take_along_axis(distances, rows, axis=1)
+    order = np.argsort(top, axis=1, kind='stable')
+    return np.take_along_axis(rows, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+class TableIndex:
+    """
+    Passages in a chunk table with their embedding matrix, searched exactly.
+
+    Implements the subset of the ChromaDB collection interface the app uses
+    (count, query, get), returning results in the same shapes, so the app can
+    serve it in place of a collection. Subclasses set table, embeddings and norms.
+    """
+
+    table = None
+    embeddings = None
+    norms = None
+    _rows_by_id = None
+
+    def count(self) -> int:
+        return self.table.num_rows
+
+    def query(self, query_embeddings, n_results: int = 10, **_) -> Dict[str, List]:
+        """
+        Exact nearest passages by squared L2 distance, like collection.query().
+
+        Returns:
+            {'ids', 'documents', 'metadatas', 'distances'}, one list per query
+        """
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        if self.count() == 0:
+            return {key: [[] for _ in query_embeddings] for key in results}
+        all_rows, all_distances = exact_top_k(self.embeddings, self.norms, query_embeddings, n_results)
+        for rows, distances in zip(all_rows, all_distances):
+            records = table_records(self.table, rows)
+            results['ids'].append([record['id'] for record in records])
+            results['documents'].append([record['document'] for record in records])
+            results['metadatas'].append([record['metadata'] for record in records])
+            results['distances'].append(distances.tolist())
+        return results
+
+    def _matching_rows(self, where: Dict) -> np.ndarray:
+        import pyarrow.compute as pc
+        operators = {'$eq': pc.equal, '$ne': pc.not_equal, '$gt': pc.greater, '$gte': pc.greater_equal,
+                     '$lt': pc.less, '$lte': pc.less_equal}
+        mask = None
+        for field, condition in where.items():
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            for operator, value in condition.items():
+                matches = operators[operator](self.table[field], value)
+                mask = matches if mask is None else pc.and_(mask, matches)
+        if mask is None:
+            return np.arange(self.count())
+        return np.flatnonzero(mask.to_numpy(zero_copy_only=False).astype(bool))
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None,
+            limit: Optional[int] = None, offset: int = 0,
+            include: List[str] = ('metadatas', 'documents')) -> Dict[str, List]:
+        """
+        Fetch passages by ID or by a metadata filter, like collection.get().
+
+        where supports equality and $eq/$ne/$gt/$gte/$lt/$lte conditions on
+        metadata fields, combined with AND.
+        """
+        if ids is not None:
+            if self._rows_by_id is None:
+                self._rows_by_id = {cid: row for row, cid in enumerate(self.table['id'].to_pylist())}
+            rows = np.asarray([self._rows_by_id[cid] for cid in ids if cid in self._rows_by_id], dtype=np.int64)
+        else:
+            rows = self._matching_rows(where or {})
+        rows = rows[offset:offset + limit if limit is not None else None]
+
+        records = table_records(self.table, rows)
+        results = {'ids': [record['id'] for record in records]}
+        if 'documents' in include:
+            results['documents'] = [record['document'] for record in records]
+        if 'metadatas' in include:
+            results['metadatas'] = [record['metadata'] for record in records]
+        if 'embeddings' in include:
+            results['embeddings'] = np.asarray(self.embeddings[rows])
+        return results
+
+class ExactIndex(TableIndex):
+    """
+    Passage embeddings as one float32 matrix, searched exactly.
+
+    Files, all inside one directory:
+        meta.json        count and dimension
+        chunks.parquet   ID, text and metadata of each row (see chunk_table.py)
+        embeddings.npy   (count, dim) float32 matrix
+        norms.npy        squared norm of each row (float32)
+    """
+
+    def __init__(self, directory: str, in_memory: bool = False):
+        """
+        Args:
+            directory: Index directory
+            in_memory: Read the whole matrix into memory instead of memory-mapping it
+        """
+        import pyarrow.parquet as pq
+
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.dim = meta['dim']
+        self.table = pq.read_table(os.path.join(directory, CHUNKS_FILE), memory_map=True)
+        self.ids = self.table['id'].to_pylist()
+        self.embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode=None if in_memory else 'r')
+        self.norms = np.load(os.path.join(directory, 'norms.npy'))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes of the matrix and norms (resident once touched, if memory-mapped)."""
+        return self.embeddings.nbytes + self.norms.nbytes
+
+    def search(self, query: np.ndarray, n_results: int = 5) -> Tuple[List[str], List[float]]:
+        """
+        Find the nearest passages to a query embedding.
+
+        Returns:
+            (chunk IDs, squared L2 distances), nearest first
+        """
+        rows, distances = exact_top_k(self.embeddings, self.norms, query, n_results)
+        return [self.ids[i] for i in rows[0]], distances[0].tolist()
+
+def build_exact_index(collection, directory: str, page_size: int = 1000) -> ExactIndex:
+    """
+    Build an exact index of every passage in a collection.
+
+    Embeddings are paged out of the collection straight into the on-disk
+    matrix, and documents and metadata into the chunk table. The new index
+    replaces any previous one once it is complete.
+
+    Args:
+        collection: ChromaDB collection to index
+        directory: Directory the index is written to
+        page_size: Number of embeddings read from the collection at a time
+
+    Returns:
+        The loaded index
+    """
+    import pyarrow.parquet as pq
+
+    tmp_directory = directory + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    count = collection.count()
+    embeddings = norms = None
+    with pq.ParquetWriter(os.path.join(tmp_directory, CHUNKS_FILE), chunk_schema()) as parquet:
+        for offset in range(0, count, page_size):
+            page = collection.get(offset=offset, limit=page_size,
+                                  include=['embeddings', 'metadatas', 'documents'])
+            vectors = np.asarray(page['embeddings'], dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(os.path.join(tmp_directory, 'embeddings.npy'), mode='w+',
+                                                       dtype=np.float32, shape=(count, vectors.shape[1]))
+                norms = np.empty(count, dtype=np.float32)
+            embeddings[offset:offset + len(vectors)] = vectors
+            norms[offset:offset + len(vectors)] = np.einsum('ij,ij->i', vectors, vectors)
+            parquet.write_table(page_table(page))
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(tmp_directory, 'embeddings.npy'), embeddings)
+        norms = np.zeros(0, dtype=np.float32)
+    else:
+        embeddings.flush()
+    dim = int(embeddings.shape[1])
+    del embeddings
+
+    np.save(os.path.join(tmp_directory, 'norms.npy'), norms)
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+        json.dump({'count': count, 'dim': dim}, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return ExactIndex(directory)
+
+def load_exact_index(directory: str, in_memory: bool = False) -> Optional[ExactIndex]:
+    """Load an exact index, or None if none has been built (or it predates the chunk table)."""
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        return None
+    if not os.path.exists(os.path.join(directory, CHUNKS_FILE)):
+        print(f"Warning: exact index in {directory} stores no passages; rebuild it with --exact-index")
+        return None
+    return ExactIndex(directory, in_memory=in_memory)
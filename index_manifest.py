@@ -0,0 +1,148 @@
+"""
+Content-hash manifest for incremental re-indexing.
+Records a hash per case and per chunk so a rebuild only touches what changed.
+"""
+
+import hashlib
+import json
+import os
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from change_log import ChangeLog
+
+MANIFEST_VERSION = 1
+
+def chunk_id(chunk: Dict) -> str:
+    """Collection ID of a chunk."""
+    return f"{chunk['case_id']}_chunk_{chunk['chunk_index']}"
+
+def chunk_content_hash(chunk: Dict) -> str:
+    """Hash of everything stored for a chunk: its text and its metadata."""
+    payload = json.dumps(chunk, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def case_content_hash(chunk_hashes: Dict[str, str]) -> str:
+    """Hash of a case, derived from the hashes of its chunks."""
+    digest = hashlib.sha256()
+    for cid in sorted(chunk_hashes):
+        digest.update(f"{cid}:{chunk_hashes[cid]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+class IndexManifest:
+    """
+    Per-case and per-chunk content hashes of what is currently in the collection.
+
+    Stored as JSON:
+        {"version": 1, "cases": {case_id: {"hash": ..., "chunks": {chunk_id: hash}}}}
+    plus a change log next to it (index_manifest.log.jsonl) holding the
+    [case_id, entry] records saved since the JSON was last compacted.
+    """
+
+    def __init__(self, path: str, cases: Dict[str, Dict] = None):
+        self.path = path
+        self.cases = cases or {}
+        self._seen = set()
+        self._log = ChangeLog(os.path.splitext(path)[0] + '.log.jsonl')
+        # Entries (None for removed cases) not yet saved to the log
+        self._changes = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'IndexManifest':
+        """Load a manifest and replay its change log, or start an empty one if none exists yet."""
+        manifest = cls(path)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != MANIFEST_VERSION:
+                print(f"Warning: ignoring manifest with unsupported version {data.get('version')}")
+                return manifest
+            manifest.cases = data['cases']
+        manifest._log.replay(manifest.cases)
+        return manifest
+
+    def save(self):
+        """Durably append the cases changed since the last save to the change log."""
+        self._log.append(self._changes)
+        self._changes = {}
+
+    def compact(self):
+        """Atomically rewrite the whole manifest next to the collection and clear the change log."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'cases': self.cases}, f)
+        os.replace(tmp_path, self.path)
+        self._log.clear()
+        self._changes = {}
+
+    def diff_case(self, case_id: str, chunks: List[Dict]) -> Tuple[List[Dict], List[str], Optional[Dict]]:
+        """
+        Diff the current chunks of a case against the manifest, without recording them.
+
+        Args:
+            case_id: Case being re-indexed
+            chunks: All chunks the case currently produces
+
+        Returns:
+            (chunks that are new or changed, IDs of chunks that no longer exist,
+             manifest entry to pass to commit_case() once they are stored, or
+             None if the case is unchanged)
+        """
+        chunk_hashes = {chunk_id(chunk): chunk_content_hash(chunk) for chunk in chunks}
+        case_hash = case_content_hash(chunk_hashes)
+
+        previous = self.cases.get(case_id, {'hash': None, 'chunks': {}})
+        if previous['hash'] == case_hash:
+            return [], [], None
+
+        old_hashes = previous['chunks']
+        changed = [chunk for chunk in chunks
+                   if old_hashes.get(chunk_id(chunk)) != chunk_hashes[chunk_id(chunk)]]
+        removed = [cid for cid in old_hashes if cid not in chunk_hashes]
+        return changed, removed, {'hash': case_hash, 'chunks': chunk_hashes}
+
+    def commit_case(self, case_id: str, entry: Optional[Dict]):
+        """Record a case as indexed, with the entry returned by diff_case()."""
+        self._seen.add(case_id)
+        if entry is not None:
+            self.cases[case_id] = entry
+            self._changes[case_id] = entry
+
+    def update_case(self, case_id: str, chunks: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """
+        Record the current chunks of a case and diff them against the manifest.
+
+        Returns:
+            (chunks that are new or changed, IDs of chunks that no longer exist)
+        """
+        changed, removed, entry = self.diff_case(case_id, chunks)
+        self.commit_case(case_id, entry)
+        return changed, removed
+
+    def mark_seen(self, case_ids: Iterable[str]):
+        """Count cases as re-indexed without diffing them (e.g. done before a resume)."""
+        self._seen.update(case_ids)
+
+    def remove_unseen_cases(self) -> List[str]:
+        """
+        Drop cases that were not re-indexed in this run.
+
+        Returns:
+            IDs of all chunks belonging to the removed cases
+        """
+        removed_ids = []
+        for case_id in [cid for cid in self.cases if cid not in self._seen]:
+            removed_ids.extend(self.cases.pop(case_id)['chunks'])
+            self._changes[case_id] = None
+        return removed_ids
+
+def iter_id_batches(ids: Iterable[str], batch_size: int) -> Iterable[List[str]]:
+    """Split chunk IDs into lists of at most batch_size."""
+    batch = []
+    for cid in ids:
+        batch.append(cid)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,138 @@
+"""
+Progress journal and checkpoints for the ingestion pipeline.
+Lets an interrupted run of prepare_data.py resume from its last completed batch
+and records where ingestion time goes, stage by stage.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import List, Dict, Iterable, Iterator, Optional
+
+# Pipeline stages, in order
+STAGES = ('load', 'chunk', 'extract', 'dedup', 'embed', 'store', 'graph')
+
+class IngestionJournal:
+    """
+    Append-only event journal plus the latest durable checkpoint of a run.
+
+    Files, all inside one directory:
+        journal.jsonl         one JSON event per line (run start, checkpoints, finish)
+        checkpoint.json       state needed to resume, replaced atomically
+        case_summaries.jsonl  citation summaries of every case processed so far;
+                              truncated back to the checkpointed size on resume
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.journal_path = os.path.join(directory, 'journal.jsonl')
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.json')
+        self.summaries_path = os.path.join(directory, 'case_summaries.jsonl')
+        self.timings = {stage: 0.0 for stage in STAGES}
+        self.batches = 0
+
+    def log(self, event: str, **fields):
+        """Durably append an event to the journal."""
+        record = {'event': event, 'time': time.time(), **fields}
+        with open(self.journal_path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block of work against a pipeline stage."""
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - began
+
+    def add_timings(self, timings: Dict[str, float]):
+        for name, seconds in timings.items():
+            self.timings[name] += seconds
+
+    def timed(self, name: str, items: Iterable) -> Iterator:
+        """Iterate items, timing how long producing each one takes."""
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def load_checkpoint(self) -> Optional[Dict]:
+        """Latest checkpoint, or None if the last run finished or never checkpointed."""
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        self.timings.update(checkpoint.get('timings', {}))
+        self.batches = checkpoint.get('batches', 0)
+        return checkpoint
+
+    def load_summaries(self, checkpoint: Dict) -> List[Dict]:
+        """Case summaries covered by a checkpoint, dropping any written after it."""
+        with open(self.summaries_path, 'r+') as f:
+            f.truncate(checkpoint['summaries_bytes'])
+            f.seek(0)
+            return [json.loads(line) for line in f]
+
+    def start(self, resumed_from: Optional[Dict] = None, **fields):
+        """Begin a run; a fresh run discards the previous run's checkpoint."""
+        if resumed_from is None:
+            for path in (self.checkpoint_path, self.summaries_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            open(self.summaries_path, 'w').close()
+            self.log('start', **fields)
+        else:
+            self.log('resume', cases_done=resumed_from['cases_done'], **fields)
+
+    def checkpoint(self, new_summaries: List[Dict], **state):
+        """
+        Make everything up to this point durable.
+
+        Args:
+            new_summaries: Case summaries produced since the previous checkpoint
+            state: Counters needed to resume (cases_done, writer_offset, ...)
+        """
+        self.batches += 1
+        with open(self.summaries_path, 'a') as f:
+            for summary in new_summaries:
+                f.write(json.dumps(summary) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            summaries_bytes = f.tell()
+
+        checkpoint = {
+            **state,
+            'batches': self.batches,
+            'summaries_bytes': summaries_bytes,
+            'timings': self.timings
+        }
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+        self.log('checkpoint', **{key: value for key, value in checkpoint.items() if key != 'summaries_bytes'})
+
+    def finish(self, **fields):
+        """Record the run as complete; the next run starts from scratch."""
+        self.log('finish', batches=self.batches, timings=self.timings, **fields)
+        for path in (self.checkpoint_path, self.summaries_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def print_timings(self):
+        """Print seconds spent per stage."""
+        total = sum(self.timings.values()) or 1e-9
+        for stage in STAGES:
+            seconds = self.timings[stage]
+            print(f"  {stage:<8} {seconds:8.2f}s  ({100 * seconds / total:4.1f}%)")
@@ -0,0 +1,374 @@
+"""
+ONNX Runtime backend for the sentence encoder.
+Exports the SentenceTransformer model once to ONNX (optionally with dynamic int8 quantization)
+and runs it on CPU with onnxruntime and the tokenizers library, without importing PyTorch.
+"""
+
+import inspect
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+ENCODER_BACKENDS = ('torch', 'onnx')
+
+DEFAULT_ONNX_DIRECTORY = "./onnx_models"
+
+# Largest per-value difference allowed between ONNX and PyTorch embeddings
+EXPORT_TOLERANCE = 1e-4
+
+# Smallest cosine similarity allowed between quantized ONNX and PyTorch embeddings
+QUANTIZED_MIN_COSINE = 0.98
+
+# Texts used to check an export against the PyTorch model and to benchmark backends
+SAMPLE_TEXTS = [
+    "right to counsel in criminal proceedings",
+    "racial segregation in public schools",
+    "The Court overruled Plessy v. Ferguson, 163 U.S. 537 (1896), which had established "
+    "the \"separate but equal\" doctrine.",
+    "Prior to any questioning, the person must be warned that he has a right to remain silent, "
+    "that any statement he does make may be used as evidence against him, and that he has a "
+    "right to the presence of an attorney.",
+    "judicial review of acts of Congress",
+]
+
+def model_directory(model_name: str, onnx_directory: str = DEFAULT_ONNX_DIRECTORY) -> str:
+    """Directory holding the ONNX export of a model."""
+    return os.path.join(onnx_directory, model_name.replace('/', '__'))
+
+def encoder_id(model_name: str, backend: str = 'torch', quantized: bool = False) -> str:
+    """Identifier of a model as run by a backend, keying caches of its embeddings."""
+    return f"{model_name}:{backend}{':quantized' if quantized else ''}"
+
+def _pooling_mode(pooling) -> str:
+    """Pooling mode of a sentence_transformers Pooling module, across library versions."""
+    config = pooling.get_config_dict()
+    mode = config.get('pooling_mode')
+    if isinstance(mode, str):
+        return mode
+    if config.get('pooling_mode_cls_token'):
+        return 'cls'
+    if config.get('pooling_mode_max_tokens'):
+        return 'max'
+    return 'mean'
+
+def export_onnx(model_name: str, directory: str, quantize: bool = False, opset: int = 17) -> Dict:
+    """
+    Export a SentenceTransformer to ONNX and check it against the PyTorch model.
+
+    The transformer is exported with dynamic batch and sequence axes; pooling
+    and normalization are replayed in NumPy at inference time. With quantize,
+    a dynamically int8-quantized copy of the graph is written as well.
+
+    Args:
+        model_name: SentenceTransformer model to export
+        directory: Directory the export is written to
+        quantize: Also write a dynamically quantized model
+        opset: ONNX opset version
+
+    Returns:
+        Encoder config, including the measured difference from PyTorch
+
+    Raises:
+        ValueError: If the exported model's embeddings are outside tolerance
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    model.eval()
+    transformer = model[0]
+    tokenizer = transformer.tokenizer
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids')
+                   if name in tokenizer.model_input_names]
+
+    class _TokenEmbeddings(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(input_names, inputs))).last_hidden_state
+
+    os.makedirs(directory, exist_ok=True)
+    sample = tokenizer(SAMPLE_TEXTS[:2], padding=True, truncation=True, return_tensors='pt')
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['token_embeddings'] = {0: 'batch', 1: 'sequence'}
+    export_options = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        # torch 2.5+ can export through dynamo (the default from 2.9); keep the TorchScript exporter
+        export_options['dynamo'] = False
+    with torch.no_grad():
+        torch.onnx.export(
+            _TokenEmbeddings(transformer.auto_model),
+            tuple(sample[name] for name in input_names),
+            os.path.join(directory, 'model.onnx'),
+            input_names=input_names,
+            output_names=['token_embeddings'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            **export_options
+        )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(os.path.join(directory, 'model.onnx'),
+                         os.path.join(directory, 'model.quant.onnx'),
+                         weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(directory)
+    config = {
+        'model_name': model_name,
+        'input_names': input_names,
+        'max_seq_length': model.max_seq_length,
+        'pad_token_id': tokenizer.pad_token_id or 0,
+        'dim': model.get_sentence_embedding_dimension(),
+        'pooling': _pooling_mode(model[1]),
+        'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+    }
+    with open(os.path.join(directory, 'encoder_config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+
+    reference = model.encode(SAMPLE_TEXTS, convert_to_numpy=True)
+    config['max_abs_diff'] = float(np.abs(OnnxSentenceEncoder(directory).encode(SAMPLE_TEXTS) - reference).max())
+    if config['max_abs_diff'] > EXPORT_TOLERANCE:
+        raise ValueError(f"ONNX export differs from PyTorch by {config['max_abs_diff']:.2e} "
+                         f"(tolerance {EXPORT_TOLERANCE:.0e})")
+    if quantize:
+        quantized = OnnxSentenceEncoder(directory, quantized=True).encode(SAMPLE_TEXTS)
+        cosines = np.sum(quantized * reference, axis=1) / (
+            np.linalg.norm(quantized, axis=1) * np.linalg.norm(reference, axis=1))
+        config['quantized_min_cosine'] = float(cosines.min())
+        if config['quantized_min_cosine'] < QUANTIZED_MIN_COSINE:
+            raise ValueError(f"Quantized ONNX export has cosine {config['quantized_min_cosine']:.4f} "
+                             f"to PyTorch (minimum {QUANTIZED_MIN_COSINE})")
+    with open(os.path.join(directory, 'encoder_config.json'), 'w') as f:
+        json.dump(config, f, indent=2)
+    return config
+
+class _BatchTokenizer:
+    """Callable subset of a transformers tokenizer, backed by the tokenizers library."""
+
+    def __init__(self, path: str, max_length: int, pad_token_id: int = 0):
+        from tokenizers import Tokenizer
+        self._tokenizer = Tokenizer.from_file(path)
+        self.max_length = max_length
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, texts: List[str], add_special_tokens: bool = True, truncation: bool = True,
+                 max_length: Optional[int] = None, padding: bool = False) -> Dict[str, List]:
+        tokenizer = self._tokenizer
+        if truncation:
+            tokenizer.enable_truncation(max_length or self.max_length)
+        else:
+            tokenizer.no_truncation()
+        if padding:
+            tokenizer.enable_padding(pad_id=self.pad_token_id)
+        else:
+            tokenizer.no_padding()
+        encodings = tokenizer.encode_batch(texts, add_special_tokens=add_special_tokens)
+        return {
+            'input_ids': [encoding.ids for encoding in encodings],
+            'attention_mask': [encoding.attention_mask for encoding in encodings],
+            'token_type_ids': [encoding.type_ids for encoding in encodings]
+        }
+
+class OnnxSentenceEncoder:
+    """
+    Sentence encoder running an ONNX export with onnxruntime.
+
+    Exposes the parts of the SentenceTransformer interface the app and the
+    ingestion pipeline use (encode, tokenizer, max_seq_length,
+    get_sentence_embedding_dimension), so it can stand in for the PyTorch model.
+    """
+
+    def __init__(self, directory: str, quantized: bool = False, num_threads: Optional[int] = None):
+        """
+        Args:
+            directory: Directory written by export_onnx()
+            quantized: Run the dynamically quantized model
+            num_threads: onnxruntime intra-op threads (default: onnxruntime's choice)
+        """
+        import onnxruntime
+
+        with open(os.path.join(directory, 'encoder_config.json'), 'r') as f:
+            self.config = json.load(f)
+        self.max_seq_length = self.config['max_seq_length']
+        self.tokenizer = _BatchTokenizer(os.path.join(directory, 'tokenizer.json'), self.max_seq_length,
+                                         self.config.get('pad_token_id', 0))
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        model_file = 'model.quant.onnx' if quantized else 'model.onnx'
+        self.session = onnxruntime.InferenceSession(os.path.join(directory, model_file), options,
+                                                    providers=['CPUExecutionProvider'])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config['dim']
+
+    def _pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mode = self.config['pooling']
+        if mode == 'cls':
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        if mode == 'max':
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, texts, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False) -> np.ndarray:
+        """
+        Embed texts.
+
+        Args:
+            texts: A text or list of texts
+            batch_size: Number of texts per inference call
+            show_progress_bar: Accepted for SentenceTransformer compatibility
+            convert_to_numpy: Accepted for SentenceTransformer compatibility
+            normalize_embeddings: L2-normalize even if the model does not
+
+        Returns:
+            float32 array of shape (len(texts), dim), or (dim,) for a single text
+        """
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True)
+            inputs = {name: np.asarray(encoded[name], dtype=np.int64) for name in self.config['input_names']}
+            token_embeddings = self.session.run(None, inputs)[0]
+            batches.append(self._pool(token_embeddings, inputs['attention_mask']))
+        embeddings = (np.concatenate(batches) if batches
+                      else np.zeros((0, self.config['dim']))).astype(np.float32)
+        if self.config['normalize'] or normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings[0] if single else embeddings
+
+def ensure_onnx_export(model_name: str, onnx_directory: str = DEFAULT_ONNX_DIRECTORY,
+                       quantized: bool = False) -> str:
+    """Export a model to ONNX unless already exported; returns its directory."""
+    directory = model_directory(model_name, onnx_directory)
+    model_file = 'model.quant.onnx' if quantized else 'model.onnx'
+    if not os.path.exists(os.path.join(directory, model_file)):
+        print(f"Exporting {model_name} to ONNX in {directory}...")
+        export_onnx(model_name, directory, quantize=quantized)
+    return directory
+
+def load_encoder(model_name: str, backend: str = 'torch',
+                 onnx_directory: str = DEFAULT_ONNX_DIRECTORY, quantized: bool = False,
+                 num_threads: Optional[int] = None):
+    """
+    Load the sentence encoder with the selected backend.
+
+    The ONNX backend exports the model on first use (which needs PyTorch
+    once) and loads the export without PyTorch afterwards.
+
+    Args:
+        model_name: SentenceTransformer model name
+        backend: 'torch' for SentenceTransformer, or 'onnx' for onnxruntime
+        onnx_directory: Directory holding ONNX exports
+        quantized: Use the dynamically quantized ONNX model
+        num_threads: onnxruntime intra-op threads (onnx backend only)
+
+    Returns:
+        SentenceTransformer or OnnxSentenceEncoder
+    """
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+    if backend == 'onnx':
+        directory = ensure_onnx_export(model_name, onnx_directory, quantized)
+        return OnnxSentenceEncoder(directory, quantized=quantized, num_threads=num_threads)
+    raise ValueError(f"Unknown encoder backend: {backend} (expected one of {ENCODER_BACKENDS})")
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss survives exec on Linux, so a child started by a large parent
+    # would report the parent's peak; VmHWM belongs to this process alone
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _measure_backend(model_name: str, backend: str, onnx_directory: str, quantized: bool,
+                     queries: int) -> Dict:
+    """Cold start, per-query latency and peak memory of one backend, in this process."""
+    began = time.perf_counter()
+    encoder = load_encoder(model_name, backend, onnx_directory, quantized)
+    encoder.encode(SAMPLE_TEXTS[:1])
+    load_seconds = time.perf_counter() - began
+
+    latencies = []
+    for i in range(queries):
+        began = time.perf_counter()
+        encoder.encode([SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]])
+        latencies.append(time.perf_counter() - began)
+    return {
+        'load_seconds': load_seconds,
+        'p50_ms': 1000 * float(np.percentile(latencies, 50)),
+        'p99_ms': 1000 * float(np.percentile(latencies, 99)),
+        'peak_rss_mb': _peak_rss_mb(),
+        'embeddings': encoder.encode(SAMPLE_TEXTS).tolist()
+    }
+
+def benchmark_backends(model_name: str, onnx_directory: str = DEFAULT_ONNX_DIRECTORY,
+                       queries: int = 200) -> Dict[str, Dict]:
+    """
+    Compare encoder backends, each measured in a fresh process.
+
+    Exports missing ONNX models first so export time is not counted as
+    cold start.
+
+    Returns:
+        Per backend ('torch', 'onnx', 'onnx-quantized'): load_seconds, p50_ms,
+        p99_ms, peak_rss_mb and max_abs_diff from the PyTorch embeddings
+    """
+    directory = model_directory(model_name, onnx_directory)
+    if not os.path.exists(os.path.join(directory, 'model.quant.onnx')):
+        export_onnx(model_name, directory, quantize=True)
+
+    results = {}
+    for name, backend, quantized in (('torch', 'torch', False), ('onnx', 'onnx', False),
+                                     ('onnx-quantized', 'onnx', True)):
+        output = subprocess.run(
+            [sys.executable, __file__, '--measure', backend, '--model', model_name,
+             '--onnx-directory', onnx_directory, '--queries', str(queries)]
+            + (['--quantized'] if quantized else []),
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[name] = json.loads(output.strip().splitlines()[-1])
+
+    reference = np.asarray(results['torch']['embeddings'])
+    for stats in results.values():
+        stats['max_abs_diff'] = float(np.abs(np.asarray(stats.pop('embeddings')) - reference).max())
+    return results
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export the sentence encoder to ONNX and benchmark backends")
+    parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2')
+    parser.add_argument('--onnx-directory', default=DEFAULT_ONNX_DIRECTORY)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--quantized', action='store_true')
+    parser.add_argument('--measure', choices=ENCODER_BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(_measure_backend(args.model, args.measure, args.onnx_directory,
+                                          args.quantized, args.queries)))
+    else:
+        print(f"{'backend':<16}{'load s':>8}{'p50 ms':>9}{'p99 ms':>9}{'peak MB':>9}{'max diff':>10}")
+        for name, stats in benchmark_backends(args.model, args.onnx_directory, args.queries).items():
+            print(f"{name:<16}{stats['load_seconds']:8.2f}{stats['p50_ms']:9.2f}{stats['p99_ms']:9.2f}"
+                  f"{stats['peak_rss_mb']:9.0f}{stats['max_abs_diff']:10.2e}")
@@ -0,0 +1,131 @@
+"""
+Structured passage -> citation side table.
+Records the citations found in every stored passage, as written and resolved to canonical IDs,
+in flat CSR arrays instead of JSON strings in collection metadata, with a "passages citing X" inverse.
+"""
+
+import os
+from typing import List, Iterable, Optional, Tuple
+
+import numpy as np
+
+from citations import CitationResolver, normalize_citation
+
+PASSAGE_CITATIONS_FILE = 'passage_citations.npz'
+
+class PassageCitationIndex:
+    """
+    Citations of each passage, and the passages citing each case.
+
+    The citations of the passage chunk_ids[r] are the edges
+    indptr[r]:indptr[r + 1]. For each edge, citations[e] is the citation as
+    it appears in the passage. targets[e] is its canonical ID: the case_id
+    it resolves to, or the normalized citation for cases outside the corpus.
+    The target -> passages inverse is built on the first lookup.
+    """
+
+    def __init__(self, chunk_ids: List[str], indptr: np.ndarray, citations: List[str], targets: List[str]):
+        self.chunk_ids = list(chunk_ids)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.citations = list(citations)
+        self.targets = list(targets)
+        self._rows = {cid: row for row, cid in enumerate(self.chunk_ids)}
+        self._target_index = None
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def _edges(self, chunk_id: str) -> range:
+        row = self._rows.get(chunk_id)
+        if row is None:
+            return range(0)
+        return range(self.indptr[row], self.indptr[row + 1])
+
+    def citations_of(self, chunk_id: str) -> List[str]:
+        """Citations in a passage, as written (empty for unknown passages)."""
+        return [self.citations[e] for e in self._edges(chunk_id)]
+
+    def cited_ids_of(self, chunk_id: str) -> List[str]:
+        """Canonical IDs of the cases a passage cites."""
+        return [self.targets[e] for e in self._edges(chunk_id)]
+
+    def _build_inverse(self):
+        unique, inverse = np.unique(np.asarray(self.targets, dtype=str), return_inverse=True)
+        edge_rows = np.repeat(np.arange(len(self.chunk_ids)), np.diff(self.indptr))
+        # Stable, so each target's passages keep collection order
+        self._citing_rows = edge_rows[np.argsort(inverse, kind='stable')]
+        self._citing_indptr = np.zeros(len(unique) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, minlength=len(unique)), out=self._citing_indptr[1:])
+        self._target_index = {target: i for i, target in enumerate(unique.tolist())}
+
+    def passages_citing(self, target: str, resolver: Optional[CitationResolver] = None) -> List[str]:
+        """
+        Chunk IDs of the passages citing a case.
+
+        Args:
+            target: A case_id, or any citation of the case
+            resolver: Resolves citations to case IDs; without one, or for cases
+                outside the corpus, the citation is matched in normalized form
+
+        Returns:
+            Chunk IDs, each listed once, in collection order
+        """
+        if self._target_index is None:
+            self._build_inverse()
+        index = self._target_index.get(target)
+        if index is None:
+            target = (resolver.resolve(target) if resolver is not None else None) or normalize_citation(target)
+            index = self._target_index.get(target)
+        if index is None:
+            return []
+        rows = self._citing_rows[self._citing_indptr[index]:self._citing_indptr[index + 1]]
+        return [self.chunk_ids[row] for row in dict.fromkeys(rows.tolist())]
+
+def build_passage_citation_index(chunk_citations: Iterable[Tuple[str, List[str]]],
+                                 resolver: CitationResolver) -> PassageCitationIndex:
+    """
+    Build the side table from (chunk ID, citations) pairs.
+
+    Args:
+        chunk_citations: Each stored passage's ID and the citations extracted from it
+        resolver: Citation resolver of the corpus
+
+    Returns:
+        The passage citation index
+    """
+    chunk_ids, indptr, citations = [], [0], []
+    for cid, chunk_cites in chunk_citations:
+        chunk_ids.append(cid)
+        citations.extend(chunk_cites)
+        indptr.append(len(citations))
+    targets = [case_id or citation for citation, case_id in zip(citations, resolver.resolve_many(citations))]
+    return PassageCitationIndex(chunk_ids, np.asarray(indptr, dtype=np.int64), citations, targets)
+
+def save_passage_citations(index: PassageCitationIndex, path: str):
+    """Atomically save the side table's arrays to a .npz file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            chunk_ids=np.asarray(index.chunk_ids, dtype=str),
+            indptr=index.indptr,
+            citations=np.asarray(index.citations, dtype=str),
+            targets=np.asarray(index.targets, dtype=str)
+        )
+    os.replace(tmp_path, path)
+
+def load_passage_citations(path: str) -> Optional[PassageCitationIndex]:
+    """Load the side table written by save_passage_citations(), or None if there is none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return PassageCitationIndex(
+            chunk_ids=data['chunk_ids'].tolist(),
+            indptr=data['indptr'],
+            citations=data['citations'].tolist(),
+            targets=data['targets'].tolist()
+        )
@@ -0,0 +1,113 @@
+"""
+Threaded producer/consumer stages connected by bounded queues.
+Used by the ingestion pipeline so chunking, encoding and database writes overlap
+instead of running one after another.
+"""
+
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List
+
+# Marks the end of a stream on a queue
+_DONE = object()
+
+class _StageFailed(Exception):
+    """Raised inside a stage thread when another stage has already failed."""
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    # Poll so a blocked producer notices when a downstream stage has failed
+    while True:
+        if stop.is_set():
+            raise _StageFailed()
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while True:
+        if stop.is_set():
+            raise _StageFailed()
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+def run_stages(source: Iterable, stages: List[Callable], queue_size: int = 2) -> Iterator:
+    """
+    Run a source iterable and a chain of stage functions concurrently.
+
+    The source is drained in its own thread and each stage function runs in
+    its own thread, applied to items in order; bounded queues between them
+    provide backpressure, so a fast stage blocks rather than buffering without
+    limit. Outputs of the last stage are yielded in the calling thread, which
+    acts as the final consumer. Wall-clock time approaches that of the
+    slowest stage.
+
+    If any stage (or the consumer) raises, all threads stop and the first
+    exception is re-raised to the caller.
+
+    Args:
+        source: Iterable producing work items
+        stages: Functions applied to each item in turn
+        queue_size: Maximum items waiting between two stages
+
+    Yields:
+        Output of the last stage for each source item, in source order
+    """
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def produce():
+        try:
+            for item in source:
+                _put(queues[0], item, stop)
+            _put(queues[0], _DONE, stop)
+        except _StageFailed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def work(stage: Callable, inbox: queue.Queue, outbox: queue.Queue):
+        try:
+            while True:
+                item = _get(inbox, stop)
+                if item is _DONE:
+                    _put(outbox, _DONE, stop)
+                    return
+                _put(outbox, stage(item), stop)
+        except _StageFailed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=produce, name='pipeline-source', daemon=True)]
+    for i, stage in enumerate(stages):
+        threads.append(threading.Thread(
+            target=work, args=(stage, queues[i], queues[i + 1]),
+            name=f'pipeline-{getattr(stage, "__name__", i)}', daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            try:
+                item = _get(queues[-1], stop)
+            except _StageFailed:
+                break
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        # Also reached when the consumer raises or stops iterating early
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
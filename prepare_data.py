@@ -3,21 +3,39 @@ Data preparation script for semantic legal search with citation support.
 This script loads legal case data, extracts citations, and prepares it for embedding.
 """
 
+import argparse
+import csv
 import json
-import re
-from typing import List, Dict, Tuple
-from sentence_transformers import SentenceTransformer
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Tuple, Iterable, Iterator, NamedTuple, Optional
+import numpy as np
 import chromadb
 from chromadb.config import Settings
-
-# Citation pattern matcher for legal citations
-# Matches formats like: "123 U.S. 456", "789 F.2d 012", etc.
-CITATION_PATTERN = r'\b(\d+)\s+([A-Z][a-z]*\.?\s?[A-Z]*\.?[0-9]?[a-z]?)\s+(\d+)\b'
-
-def extract_citations(text: str) -> List[str]:
-    """Extract legal citations from text."""
-    citations = re.findall(CITATION_PATTERN, text)
-    return [f"{vol} {reporter} {page}" for vol, reporter, page in citations]
+from chunking import chunk_legal_document_by_sentences, chunk_legal_document_by_tokens, get_tokenizer
+from citations import CitationResolver, extract_citations, find_citations, find_parallel_citations
+from encoding import BucketedEncoder, EmbeddingCache, EncoderPool, encode_with_cache
+from collection_writer import PagedCollectionWriter
+from dedup import DuplicateLinks, NearDuplicateFilter
+from index_manifest import IndexManifest, chunk_id, iter_id_batches
+from ingest_journal import IngestionJournal
+from onnx_encoder import DEFAULT_ONNX_DIRECTORY, ENCODER_BACKENDS, encoder_id, load_encoder
+from passage_citations import PASSAGE_CITATIONS_FILE, build_passage_citation_index, save_passage_citations
+from pipeline import run_stages
+from quantized_index import QUANTIZED_DTYPES, build_quantized_index, measure_recall
+from exact_index import build_exact_index
+from snapshot import write_snapshot
+
+MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# Stamp written next to the collection once a run has finished writing every index file;
+# the app reloads when it changes
+INDEX_VERSION_FILE = 'index_version.json'
 
 def chunk_legal_document(case_text: str, case_id: str, case_name: str,
                          chunk_size: int = 500, overlap: int = 100) -> List[Dict]:
@@ -59,6 +77,28 @@ def chunk_legal_document(case_text: str, case_id: str, case_name: str,
 
     return chunks
 
+# Chunking strategies selectable for ingestion
+CHUNKING_MODES = ('words', 'tokens', 'sentences')
+
+def chunk_case(case: Dict, chunking: str = 'words') -> List[Dict]:
+    """
+    Chunk a case with the selected strategy.
+
+    Args:
+        case: Case dict
+        chunking: 'words' for fixed word windows (chunk_legal_document),
+            'tokens' for windows filling the encoder's token budget, or
+            'sentences' for passages cut on sentence and paragraph boundaries
+    """
+    if chunking == 'words':
+        return chunk_legal_document(case['text'], case['case_id'], case['case_name'])
+    if chunking == 'tokens':
+        return chunk_legal_document_by_tokens(case['text'], case['case_id'], case['case_name'],
+                                              get_tokenizer(MODEL_NAME))
+    if chunking == 'sentences':
+        return chunk_legal_document_by_sentences(case['text'], case['case_id'], case['case_name'])
+    raise ValueError(f"Unknown chunking mode: {chunking} (expected one of {CHUNKING_MODES})")
+
 def create_sample_legal_dataset() -> List[Dict]:
     """
     Create a sample dataset of legal cases with citations.
@@ -117,126 +157,832 @@ def create_sample_legal_dataset() -> List[Dict]:
 
     return cases
 
-def build_citation_graph(cases: List[Dict]) -> Dict[str, Dict]:
+# Fields every case record carries, whatever source it was loaded from
+CASE_FIELDS = ('case_id', 'case_name', 'citation', 'year', 'court', 'text')
+
+# Opinion files picked up when loading from a directory
+OPINION_FILE_EXTENSIONS = ('.json', '.txt')
+
+def _normalize_case(record: Dict, default_id: str = '') -> Dict:
+    """Coerce a raw record into the case dict shape used by the pipeline."""
+    case = {field: record.get(field) for field in CASE_FIELDS}
+    case['case_id'] = str(case['case_id'] or default_id)
+    case['case_name'] = case['case_name'] or case['case_id']
+    case['citation'] = case['citation'] or ''
+    case['court'] = case['court'] or ''
+    case['text'] = case['text'] or ''
+    try:
+        case['year'] = int(case['year']) if case['year'] not in (None, '') else None
+    except (TypeError, ValueError):
+        case['year'] = None
+    return case
+
+def _iter_jsonl_cases(path: str) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                yield _normalize_case(json.loads(line), default_id=f"line_{line_no}")
+
+def _iter_csv_cases(path: str) -> Iterator[Dict]:
+    # Full opinions easily exceed the csv module's default 128KB field limit
+    csv.field_size_limit(sys.maxsize)
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        for row_no, row in enumerate(csv.DictReader(f), 1):
+            yield _normalize_case(row, default_id=f"row_{row_no}")
+
+def _iter_directory_cases(path: str) -> Iterator[Dict]:
+    for name in sorted(os.listdir(path)):
+        stem, ext = os.path.splitext(name)
+        if ext.lower() not in OPINION_FILE_EXTENSIONS:
+            continue
+        with open(os.path.join(path, name), 'r', encoding='utf-8') as f:
+            if ext.lower() == '.json':
+                yield _normalize_case(json.load(f), default_id=stem)
+            else:
+                yield _normalize_case({'text': f.read()}, default_id=stem)
+
+def iter_legal_cases(source: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Stream legal cases one at a time from a corpus dump.
+
+    Args:
+        source: Path to a JSONL file, a CSV file, or a directory of opinion
+            files (one JSON case or plain-text opinion per file). When None,
+            the built-in sample dataset is used.
+
+    Yields:
+        Case dicts with case_id, case_name, citation, year, court and text
     """
-    Build a citation graph showing which cases cite which other cases.
+    if source is None:
+        for case in create_sample_legal_dataset():
+            yield _normalize_case(case)
+    elif os.path.isdir(source):
+        yield from _iter_directory_cases(source)
+    elif source.lower().endswith('.jsonl'):
+        yield from _iter_jsonl_cases(source)
+    elif source.lower().endswith('.csv'):
+        yield from _iter_csv_cases(source)
+    else:
+        raise ValueError(f"Unsupported corpus source: {source} (expected .jsonl, .csv or a directory)")
+
+def summarize_case_citations(case: Dict) -> Dict:
+    """Reduce a case to what the citation graph needs, dropping its text."""
+    matches = find_citations(case['text'])
+    return {
+        'case_id': case['case_id'],
+        'citation': case['citation'],
+        'citations_in_text': [match.citation for match in matches],
+        'parallel_citations': find_parallel_citations(case['text'], matches)
+    }
+
+def build_citation_resolver(cases: Iterable[Dict]) -> CitationResolver:
+    """
+    Build the resolver that maps citation variants and parallel citations to case IDs.
+
+    Args:
+        cases: Summaries from summarize_case_citations()
+    """
+    resolver = CitationResolver()
+    for case in cases:
+        resolver.add_case(case['case_id'], case['citation'], case.get('parallel_citations', ()))
+    return resolver.finalize()
+
+class CitationCSR(NamedTuple):
+    """
+    Citation graph in compressed sparse row form.
+
+    Node i is case_ids[i]. The cases node i cites are
+    cites_indices[cites_indptr[i]:cites_indptr[i + 1]], with the citation text
+    of each edge in cites_citations at the same positions; cited_by_indptr and
+    cited_by_indices hold the reverse adjacency.
+    """
+    case_ids: List[str]
+    case_citations: List[str]
+    cites_indptr: np.ndarray
+    cites_indices: np.ndarray
+    cites_citations: List[str]
+    cited_by_indptr: np.ndarray
+    cited_by_indices: np.ndarray
+
+def _counting_sort_csr(num_nodes: int, keys: List[int]) -> Tuple[np.ndarray, List[int]]:
+    """
+    Group edge positions by key in O(nodes + edges), keeping their original order.
 
     Returns:
-        Dictionary mapping case_id to citation information
+        (indptr of length num_nodes + 1, edge positions ordered by key)
     """
-    citation_graph = {}
+    counts = [0] * num_nodes
+    for key in keys:
+        counts[key] += 1
+    indptr = [0] * (num_nodes + 1)
+    for node, count in enumerate(counts):
+        indptr[node + 1] = indptr[node] + count
+    fill = indptr[:-1]
+    order = [0] * len(keys)
+    for position, key in enumerate(keys):
+        order[fill[key]] = position
+        fill[key] += 1
+    return np.asarray(indptr, dtype=np.int64), order
+
+def build_citation_csr(cases: Iterable[Dict],
+                       resolver: Optional[CitationResolver] = None) -> CitationCSR:
+    """
+    Build the citation graph as CSR adjacency arrays in a single linear pass.
+
+    Args:
+        cases: Full case dicts, or summaries from summarize_case_citations()
+        resolver: Citation resolver for the corpus; built from cases if omitted
+
+    Returns:
+        CitationCSR with forward (cites) and reverse (cited_by) adjacency
+    """
+    cases = [case if 'citations_in_text' in case else summarize_case_citations(case)
+             for case in cases]
+
+    if resolver is None:
+        resolver = build_citation_resolver(cases)
 
-    # Create lookup by citation string
-    citation_lookup = {case['citation']: case['case_id'] for case in cases}
+    # Assign integer node IDs
+    node_ids = {}
+    case_ids = []
+    case_citations = []
+    for case in cases:
+        if case['case_id'] not in node_ids:
+            node_ids[case['case_id']] = len(case_ids)
+            case_ids.append(case['case_id'])
+            case_citations.append(case['citation'])
 
+    sources, targets, edge_citations = [], [], []
     for case in cases:
-        case_id = case['case_id']
-        citations_in_text = extract_citations(case['text'])
-
-        # Find which cases are cited
-        cited_cases = []
-        for citation in citations_in_text:
-            if citation in citation_lookup:
-                cited_case_id = citation_lookup[citation]
-                if cited_case_id != case_id:  # Don't self-reference
-                    cited_cases.append({
-                        'case_id': cited_case_id,
-                        'citation': citation
-                    })
+        source = node_ids[case['case_id']]
+        citations_in_text = case['citations_in_text']
+
+        # Find which cases are cited, once each even if cited in parallel
+        seen = set()
+        for citation, cited_case_id in zip(citations_in_text, resolver.resolve_many(citations_in_text)):
+            target = node_ids.get(cited_case_id)
+            if target is None or target == source or target in seen:  # Don't self-reference
+                continue
+            seen.add(target)
+            sources.append(source)
+            targets.append(target)
+            edge_citations.append(citation)
+
+    cites_indptr, cites_order = _counting_sort_csr(len(case_ids), sources)
+    cited_by_indptr, cited_by_order = _counting_sort_csr(len(case_ids), [targets[e] for e in cites_order])
+
+    cites_indices = [targets[e] for e in cites_order]
+    return CitationCSR(
+        case_ids=case_ids,
+        case_citations=case_citations,
+        cites_indptr=cites_indptr,
+        cites_indices=np.asarray(cites_indices, dtype=np.int64),
+        cites_citations=[edge_citations[e] for e in cites_order],
+        cited_by_indptr=cited_by_indptr,
+        cited_by_indices=np.asarray([sources[cites_order[e]] for e in cited_by_order], dtype=np.int64)
+    )
+
+def citation_graph_from_csr(csr: CitationCSR) -> Dict[str, Dict]:
+    """Expand CSR arrays into the citation_graph.json dictionary shape."""
+    case_ids = csr.case_ids
+    cites_indptr = csr.cites_indptr.tolist()
+    cites_indices = csr.cites_indices.tolist()
+    cited_by_indptr = csr.cited_by_indptr.tolist()
+    cited_by_indices = csr.cited_by_indices.tolist()
 
+    citation_graph = {}
+    for node, case_id in enumerate(case_ids):
         citation_graph[case_id] = {
-            'cites': cited_cases,
-            'cited_by': []  # Will be populated in next pass
+            'cites': [
+                {'case_id': case_ids[cites_indices[e]], 'citation': csr.cites_citations[e]}
+                for e in range(cites_indptr[node], cites_indptr[node + 1])
+            ],
+            'cited_by': [
+                {'case_id': case_ids[cited_by_indices[e]], 'citation': csr.case_citations[cited_by_indices[e]]}
+                for e in range(cited_by_indptr[node], cited_by_indptr[node + 1])
+            ]
         }
+    return citation_graph
 
-    # Second pass: populate cited_by relationships
-    for case_id, info in citation_graph.items():
-        for cited in info['cites']:
-            cited_id = cited['case_id']
-            if cited_id in citation_graph:
-                citation_graph[cited_id]['cited_by'].append({
-                    'case_id': case_id,
-                    'citation': cases[[c['case_id'] for c in cases].index(case_id)]['citation']
-                })
+def save_citation_csr(csr: CitationCSR, path: str):
+    """Atomically save CSR arrays, case IDs and edge citations to a .npz file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            case_ids=np.asarray(csr.case_ids, dtype=str),
+            case_citations=np.asarray(csr.case_citations, dtype=str),
+            cites_indptr=csr.cites_indptr,
+            cites_indices=csr.cites_indices,
+            cites_citations=np.asarray(csr.cites_citations, dtype=str),
+            cited_by_indptr=csr.cited_by_indptr,
+            cited_by_indices=csr.cited_by_indices
+        )
+    os.replace(tmp_path, path)
+
+def load_citation_csr(path: str) -> CitationCSR:
+    """Load CSR arrays saved by save_citation_csr()."""
+    with np.load(path) as data:
+        return CitationCSR(
+            case_ids=data['case_ids'].tolist(),
+            case_citations=data['case_citations'].tolist(),
+            cites_indptr=data['cites_indptr'],
+            cites_indices=data['cites_indices'],
+            cites_citations=data['cites_citations'].tolist(),
+            cited_by_indptr=data['cited_by_indptr'],
+            cited_by_indices=data['cited_by_indices']
+        )
 
-    return citation_graph
+def build_citation_graph(cases: Iterable[Dict],
+                         resolver: Optional[CitationResolver] = None) -> Dict[str, Dict]:
+    """
+    Build a citation graph showing which cases cite which other cases.
+
+    Args:
+        cases: Full case dicts, or summaries from summarize_case_citations()
+            so the graph can be built without holding every opinion in memory
+        resolver: Citation resolver for the corpus; built from cases if omitted
 
-def prepare_and_store_data(persist_directory: str = "./chromadb"):
+    Returns:
+        Dictionary mapping case_id to citation information
     """
-    Main function to prepare legal data and store in ChromaDB with citation support.
+    return citation_graph_from_csr(build_citation_csr(cases, resolver))
+
+def _process_case_batch(cases: List[Dict],
+                        chunking: str = 'words') -> Tuple[List[Tuple[List[Dict], Dict]], Dict[str, float]]:
     """
-    print("Loading legal cases...")
-    cases = create_sample_legal_dataset()
+    Chunk a batch of cases and extract their citations (runs in worker processes).
 
-    print("Building citation graph...")
-    citation_graph = build_citation_graph(cases)
+    Returns:
+        ((chunks, citation summary) per case, seconds spent per stage)
+    """
+    results = []
+    timings = {'chunk': 0.0, 'extract': 0.0}
+    for case in cases:
+        began = time.perf_counter()
+        chunks = chunk_case(case, chunking)
+        chunked = time.perf_counter()
+        summary = summarize_case_citations(case)
+        timings['chunk'] += chunked - began
+        timings['extract'] += time.perf_counter() - chunked
+        results.append((chunks, summary))
+    return results, timings
+
+def process_cases(cases: Iterable[Dict], workers: int = 1, cases_per_task: int = 32,
+                  timings: Optional[Dict[str, float]] = None,
+                  chunking: str = 'words') -> Iterator[Tuple[List[Dict], Dict]]:
+    """
+    Chunk cases and extract their citations, optionally across a process pool.
 
-    # Save citation graph for later use
-    with open('citation_graph.json', 'w') as f:
-        json.dump(citation_graph, f, indent=2)
+    Results are yielded in input order, so chunk IDs and the citation graph are
+    identical to the serial path. Only a bounded window of batches is in flight
+    at once, keeping memory flat on large streamed corpora.
 
-    print("Chunking documents...")
-    all_chunks = []
-    for case in cases:
-        chunks = chunk_legal_document(
-            case['text'],
-            case['case_id'],
-            case['case_name']
-        )
-        all_chunks.extend(chunks)
+    Args:
+        cases: Iterable of case dicts (e.g. from iter_legal_cases)
+        workers: Number of worker processes; 1 runs in the current process
+        cases_per_task: Number of cases sent to a worker per task
+        timings: If given, chunk/extract seconds (summed over workers) are added to it
+        chunking: Chunking strategy (see chunk_case)
+
+    Yields:
+        (chunks, citation summary) for each case
+    """
+    def collect(output):
+        results, batch_timings = output
+        if timings is not None:
+            for stage, seconds in batch_timings.items():
+                timings[stage] = timings.get(stage, 0.0) + seconds
+        return results
+
+    case_iter = iter(cases)
+    batches = iter(lambda: list(itertools.islice(case_iter, cases_per_task)), [])
+
+    if workers <= 1:
+        for batch in batches:
+            yield from collect(_process_case_batch(batch, chunking))
+        return
+
+    # Spawned, not forked: this runs in the pipeline's producer thread, while the
+    # encoder thread may be inside torch or tokenizers (see EncoderPool)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        in_flight = deque()
+        for batch in itertools.islice(batches, workers * 2):
+            in_flight.append(executor.submit(_process_case_batch, batch, chunking))
+        while in_flight:
+            results = collect(in_flight.popleft().result())
+            batch = next(batches, None)
+            if batch:
+                in_flight.append(executor.submit(_process_case_batch, batch, chunking))
+            yield from results
+
+def _case_metadata(chunk: Dict) -> Dict:
+    """ChromaDB metadata for a single chunk (its citations go to the passage citation index)."""
+    metadata = {
+        'case_id': chunk['case_id'],
+        'case_name': chunk['case_name'],
+        'chunk_index': chunk['chunk_index'],
+        'position_pct': chunk['position_pct'],
+        'word_count': chunk['word_count']
+    }
+    # Recorded by the token-aware and sentence chunkers
+    for key in ('token_count', 'start_char', 'end_char'):
+        if key in chunk:
+            metadata[key] = chunk[key]
+    return metadata
+
+# Indexes kept next to the collection that copy its embeddings (see quantized_index.py, exact_index.py)
+SIDE_INDEXES = ('quantized_index', 'exact_index')
+
+def _mark_side_indexes_stale(persist_directory: str):
+    """Hide the side indexes from the app (which then searches the collection) before the collection changes."""
+    for name in SIDE_INDEXES:
+        meta_path = os.path.join(persist_directory, name, 'meta.json')
+        if os.path.exists(meta_path):
+            os.replace(meta_path, os.path.join(persist_directory, name, 'meta.stale.json'))
+
+def _stale_side_index_meta(persist_directory: str, name: str) -> Optional[Dict]:
+    """Metadata of a side index marked stale by this run (or an interrupted earlier one), or None."""
+    stale_path = os.path.join(persist_directory, name, 'meta.stale.json')
+    if not os.path.exists(stale_path):
+        return None
+    with open(stale_path, 'r') as f:
+        return json.load(f)
+
+def _iter_ingest_batches(cases: Iterable[Dict], manifest: IndexManifest,
+                         writer: PagedCollectionWriter, cases_done: int, num_chunks: int,
+                         batch_size: int, workers: int, chunking: str,
+                         journal: IngestionJournal) -> Iterator[Dict]:
+    """
+    Chunk cases, diff them against the manifest and group the work into batches.
 
-    print(f"Created {len(all_chunks)} chunks from {len(cases)} cases")
+    Each batch carries the chunks to embed and write, the stale chunk IDs to
+    delete, and the manifest entries, citation summaries and progress counters
+    to commit once it is stored. Nothing is recorded in the manifest here, so
+    batches still in flight are never mistaken for stored ones.
+    """
+    def new_batch():
+        return {'chunks': [], 'deletes': [], 'entries': [], 'summaries': []}
+
+    batch = new_batch()
+    for chunks, summary in process_cases(cases, workers=workers, timings=journal.timings,
+                                         chunking=chunking):
+        cases_done += 1
+        num_chunks += len(chunks)
+
+        changed, removed, entry = manifest.diff_case(summary['case_id'], chunks)
+        # Kept for every chunk, changed or not, so the passage citation index
+        # covers the whole collection and survives a resume through the journal
+        summary['chunk_citations'] = {chunk_id(chunk): chunk['citations'] for chunk in chunks}
+        batch['deletes'].extend(removed)
+        batch['entries'].append((summary['case_id'], entry))
+        batch['summaries'].append(summary)
+        # Only drops chunks before the writer's resume offset, all of which
+        # come before anything this run hands to the writer
+        batch['chunks'].extend(writer.skip_written(changed))
+
+        # Every case in a batch is fully stored once the batch is written,
+        # which makes batch boundaries safe points to checkpoint
+        if len(batch['chunks']) >= batch_size:
+            # The writer's offset counts chunks before deduplication, like skip_written()
+            batch.update(cases_done=cases_done, num_chunks=num_chunks, stream_chunks=len(batch['chunks']))
+            yield batch
+            batch = new_batch()
+
+    batch.update(cases_done=cases_done, num_chunks=num_chunks, stream_chunks=len(batch['chunks']), last=True)
+    yield batch
+
+def _iter_pending_batches(source: Optional[str], manifest: IndexManifest, pending: Iterable[str],
+                          chunking: str, batch_size: int) -> Iterator[Dict]:
+    """
+    Re-chunk the cases holding released near-duplicates and batch those chunks for storing.
 
-    print("Loading embedding model...")
-    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    Yields:
+        Batches shaped like those of _iter_ingest_batches(), with nothing to delete
+    """
+    pending = set(pending)
+    case_ids = {case_id for case_id, entry in manifest.cases.items() if not pending.isdisjoint(entry['chunks'])}
+    batch = {'chunks': [], 'deletes': []}
+    for case in iter_legal_cases(source):
+        if case['case_id'] not in case_ids:
+            continue
+        batch['chunks'].extend(chunk for chunk in chunk_case(case, chunking) if chunk_id(chunk) in pending)
+        if len(batch['chunks']) >= batch_size:
+            yield batch
+            batch = {'chunks': [], 'deletes': []}
+    if batch['chunks']:
+        yield batch
+
+def prepare_and_store_data(persist_directory: str = "./chromadb",
+                           source: Optional[str] = None,
+                           batch_size: int = 256,
+                           workers: int = 1,
+                           full_rebuild: bool = False,
+                           cache_directory: Optional[str] = "./embedding_cache",
+                           page_size: int = 1000,
+                           resume: bool = False,
+                           checkpoint_interval: float = 60.0,
+                           queue_size: int = 2,
+                           chunking: str = 'words',
+                           dedup_threshold: Optional[float] = None,
+                           quantize: Optional[str] = None,
+                           exact_index: bool = False,
+                           encoder_backend: str = 'torch',
+                           onnx_quantized: bool = False,
+                           encoder_workers: int = 1,
+                           encoder_threads: Optional[int] = None,
+                           snapshot_directory: Optional[str] = None):
+    """
+    Main function to prepare legal data and store in ChromaDB with citation support.
+
+    Cases are streamed from the source one at a time; chunks are embedded and
+    stored in batches of batch_size, so memory stays flat regardless of corpus size.
+
+    Indexing is incremental: a manifest of per-case and per-chunk content hashes
+    is kept next to the collection, and only new or changed chunks are embedded
+    and upserted. Chunks of cases that disappeared from the source are deleted.
+    The collection stays queryable throughout.
+
+    Chunking, encoding and collection writes run as concurrent pipeline stages
+    connected by bounded queues (queue_size batches each), so parsing, model
+    inference and database writes overlap.
+
+    Progress is checkpointed (at most every checkpoint_interval seconds, always at
+    a batch boundary) into an ingestion journal next to the collection, together
+    with per-stage timings for load, chunk, extract, embed, store and graph. With
+    resume=True an interrupted run continues after its last checkpoint.
+
+    With dedup_threshold set, a MinHash/LSH stage ahead of the encoder drops
+    chunks whose estimated Jaccard similarity to an earlier chunk of the run
+    reaches the threshold; they are neither embedded nor stored, and the link to
+    the canonical chunk is kept in duplicate_links.json next to the collection.
+    When a canonical chunk is later deleted or changed, its near-duplicates are
+    re-chunked from the source at the end of the run and stored (or linked to
+    another canonical chunk).
 
-    print("Generating embeddings...")
-    texts = [chunk['text'] for chunk in all_chunks]
-    embeddings = model.encode(texts, show_progress_bar=True)
+    The citations found in each stored passage are kept in a structured side
+    table, passage_citations.npz next to the collection (see passage_citations.py),
+    rather than in chunk metadata.
+
+    With quantize set to 'float16' or 'int8', a quantized copy of every stored
+    embedding is also written to quantized_index/ next to the collection; the
+    app searches it first and rescores the best candidates exactly.
+
+    With exact_index set, every stored embedding is also written as one float32
+    matrix to exact_index/ next to the collection, for the app's exact NumPy
+    search backend (SEARCH_BACKEND=exact).
+
+    Both side indexes are marked stale (hidden from the app, which then searches
+    the collection) as soon as a run changes the collection, and rebuilt at the
+    end of the run.
+
+    Args:
+        persist_directory: Directory for the persistent ChromaDB client
+        source: Corpus to ingest (see iter_legal_cases); defaults to the sample dataset
+        batch_size: Number of chunks embedded and stored per batch
+        workers: Number of processes used for chunking and citation extraction
+        full_rebuild: Drop the collection and manifest and re-embed everything
+        cache_directory: Directory of the on-disk embedding cache, or None to disable it
+        page_size: Maximum number of chunks per collection write
+        resume: Continue an interrupted run from its last checkpoint
+        checkpoint_interval: Minimum seconds between checkpoints
+        queue_size: Maximum batches buffered between two pipeline stages
+        chunking: Chunking strategy, one of CHUNKING_MODES (see chunk_case)
+        dedup_threshold: Similarity above which a chunk counts as a near-duplicate,
+            or None to keep every chunk
+        quantize: Build a quantized search index, one of QUANTIZED_DTYPES, or None
+        exact_index: Build the exact in-memory search index
+        encoder_backend: Sentence encoder backend, one of ENCODER_BACKENDS
+        onnx_quantized: Run the dynamically quantized ONNX model (onnx backend only)
+        encoder_workers: Number of encoder processes; above 1, each batch is split
+            across a pool of them (raise batch_size so every worker gets a full share)
+        encoder_threads: torch (or onnxruntime) threads per encoder process
+        snapshot_directory: Also write a portable snapshot of the index here (see snapshot.py)
+    """
+    print("Loading embedding model...")
+    if encoder_workers > 1:
+        encoder = EncoderPool(MODEL_NAME, encoder_backend, encoder_workers, encoder_threads, onnx_quantized)
+        dim = encoder.dim
+    else:
+        model = load_encoder(MODEL_NAME, encoder_backend, DEFAULT_ONNX_DIRECTORY, onnx_quantized)
+        encoder = BucketedEncoder(model)
+        dim = model.get_sentence_embedding_dimension()
+    cache = None
+    if cache_directory:
+        cache = EmbeddingCache(cache_directory, encoder_id(MODEL_NAME, encoder_backend, onnx_quantized), dim)
 
-    print("Storing in ChromaDB...")
     client = chromadb.Client(Settings(
         anonymized_telemetry=False,
         persist_directory=persist_directory,
         is_persistent=True
     ))
 
-    # Delete collection if it exists
-    try:
-        client.delete_collection("legal_cases")
-    except:
-        pass
-
-    collection = client.create_collection(
+    journal = IngestionJournal(os.path.join(persist_directory, 'ingest'))
+    checkpoint = journal.load_checkpoint() if resume else None
+    journal.start(resumed_from=checkpoint, source=source)
+
+    manifest_path = os.path.join(persist_directory, 'index_manifest.json')
+    links_path = os.path.join(persist_directory, 'duplicate_links.json')
+    if full_rebuild and checkpoint is None:
+        # Delete collection if it exists
+        try:
+            client.delete_collection("legal_cases")
+        except Exception:
+            pass
+        # Written out empty now, so a resume never replays this run's changes over the old state
+        manifest = IndexManifest(manifest_path)
+        manifest.compact()
+        duplicate_links = DuplicateLinks(links_path)
+        duplicate_links.compact()
+    else:
+        manifest = IndexManifest.load(manifest_path)
+        duplicate_links = DuplicateLinks.load(links_path)
+
+    collection = client.get_or_create_collection(
         name="legal_cases",
         metadata={"description": "Legal cases with citation support"}
     )
 
-    # Prepare metadata for each chunk
-    metadatas = []
-    for chunk in all_chunks:
-        metadata = {
-            'case_id': chunk['case_id'],
-            'case_name': chunk['case_name'],
-            'chunk_index': chunk['chunk_index'],
-            'position_pct': chunk['position_pct'],
-            'citations': json.dumps(chunk['citations']),
-            'word_count': chunk['word_count']
-        }
-        metadatas.append(metadata)
-
-    # Add to collection
-    collection.add(
-        documents=texts,
-        embeddings=embeddings.tolist(),
-        metadatas=metadatas,
-        ids=[f"{chunk['case_id']}_chunk_{chunk['chunk_index']}" for chunk in all_chunks]
+    progress = {'cases_done': 0, 'num_chunks': 0, 'num_embedded': 0, 'num_deleted': 0, 'writer_offset': 0,
+                'num_duplicates': 0, 'duplicate_bytes': 0}
+    case_summaries = []
+    if checkpoint is not None:
+        progress.update({key: checkpoint.get(key, 0) for key in progress})
+        case_summaries = journal.load_summaries(checkpoint)
+        manifest.mark_seen(summary['case_id'] for summary in case_summaries)
+        print(f"Resuming after {progress['cases_done']} cases (checkpoint {checkpoint['batches']})")
+
+    writer = PagedCollectionWriter(
+        collection,
+        page_size=page_size,
+        max_batch_size=client.get_max_batch_size(),
+        progress_path=os.path.join(persist_directory, 'write_progress.json'),
+        # A full rebuild without a checkpoint just dropped what was written before
+        resume=resume and (checkpoint is not None or not full_rebuild),
+        offset=progress['writer_offset']
     )
 
-    print(f" Successfully stored {len(all_chunks)} passages in ChromaDB")
-    print(f"Citation graph saved to citation_graph.json")
+    dedup = NearDuplicateFilter(dedup_threshold) if dedup_threshold else None
+
+    def dedup_batch(batch: Dict):
+        with journal.stage('dedup'):
+            ids = [chunk_id(chunk) for chunk in batch['chunks']]
+            duplicates = dedup.filter(batch['chunks'], ids)
+            dropped = [chunk for cid, chunk in zip(ids, batch['chunks']) if cid in duplicates]
+            batch['chunks'] = [chunk for cid, chunk in zip(ids, batch['chunks']) if cid not in duplicates]
+            # A duplicate may still be stored under its ID from an earlier run
+            batch['deletes'].extend(duplicates)
+            batch['duplicates'] = duplicates
+            # Vector, document and metadata the collection no longer holds
+            batch['duplicate_bytes'] = sum(
+                4 * dim + len(chunk['text'].encode('utf-8')) + len(json.dumps(_case_metadata(chunk)))
+                for chunk in dropped
+            )
+            return batch
+
+    def encode_batch(batch: Dict):
+        with journal.stage('embed'):
+            texts = [chunk['text'] for chunk in batch['chunks']]
+            return batch, encode_with_cache(encoder, texts, cache)
+
+    print("Loading, chunking and embedding legal cases...")
+    cases = journal.timed('load', itertools.islice(iter_legal_cases(source), progress['cases_done'], None))
+    batches = _iter_ingest_batches(cases, manifest, writer, progress['cases_done'], progress['num_chunks'],
+                                   batch_size, workers, chunking, journal)
+
+    # Chunking, encoding and writing run concurrently; this thread writes
+    new_summaries = []
+    last_checkpoint = time.monotonic()
+    stages = [dedup_batch, encode_batch] if dedup is not None else [encode_batch]
+    try:
+        for batch, embeddings in run_stages(batches, stages, queue_size=queue_size):
+            written_ids = [chunk_id(chunk) for chunk in batch['chunks']]
+            with journal.stage('store'):
+                if batch['deletes'] or batch['chunks']:
+                    _mark_side_indexes_stale(persist_directory)
+                if batch['deletes']:
+                    collection.delete(ids=batch['deletes'])
+                if batch['chunks']:
+                    writer.write(
+                        ids=written_ids,
+                        documents=[chunk['text'] for chunk in batch['chunks']],
+                        metadatas=[_case_metadata(chunk) for chunk in batch['chunks']],
+                        embeddings=embeddings,
+                        advance=False
+                    )
+            for case_id, entry in batch['entries']:
+                manifest.commit_case(case_id, entry)
+            # Near-duplicates of chunks deleted or rewritten here no longer match
+            # anything stored; they are re-queued once the stream is done
+            replaced = batch['deletes'] + written_ids
+            duplicate_links.release(replaced)
+            for cid in replaced:
+                duplicate_links.discard(cid)
+            duplicate_links.update(batch.get('duplicates', {}))
+            # A resume skips every chunk below the writer's offset, near-duplicates
+            # included, so their links are saved before the offset moves past them
+            duplicate_links.save()
+            writer.advance(batch['stream_chunks'])
+            case_summaries.extend(batch['summaries'])
+            new_summaries.extend(batch['summaries'])
+            progress['num_embedded'] += len(batch['chunks'])
+            progress['num_deleted'] += len(batch['deletes']) - len(batch.get('duplicates', {}))
+            progress['num_duplicates'] += len(batch.get('duplicates', {}))
+            progress['duplicate_bytes'] += batch.get('duplicate_bytes', 0)
+            progress['cases_done'] = batch['cases_done']
+            progress['num_chunks'] = batch['num_chunks']
+
+            if batch.get('last') or time.monotonic() - last_checkpoint >= checkpoint_interval:
+                # Appends only what changed since the last checkpoint
+                manifest.save()
+                progress['writer_offset'] = writer.offset
+                journal.checkpoint(new_summaries, **progress)
+                new_summaries = []
+                last_checkpoint = time.monotonic()
+
+        writer.finish()
+
+        with journal.stage('store'):
+            for ids in iter_id_batches(manifest.remove_unseen_cases(), batch_size):
+                _mark_side_indexes_stale(persist_directory)
+                collection.delete(ids=ids)
+                progress['num_deleted'] += len(ids)
+                duplicate_links.release(ids)
+                for cid in ids:
+                    duplicate_links.discard(cid)
+
+        pending = duplicate_links.pending()
+        if pending:
+            print(f"Re-queueing {len(pending)} near-duplicates whose canonical passage was deleted or changed...")
+            # No progress file: these writes are not part of the resumable chunk stream
+            requeue_writer = PagedCollectionWriter(collection, page_size=page_size,
+                                                   max_batch_size=client.get_max_batch_size(), verbose=False)
+            for batch in _iter_pending_batches(source, manifest, pending, chunking, batch_size):
+                if dedup is not None:
+                    batch = dedup_batch(batch)
+                batch, embeddings = encode_batch(batch)
+                written_ids = [chunk_id(chunk) for chunk in batch['chunks']]
+                with journal.stage('store'):
+                    if batch['chunks']:
+                        _mark_side_indexes_stale(persist_directory)
+                        requeue_writer.write(
+                            ids=written_ids,
+                            documents=[chunk['text'] for chunk in batch['chunks']],
+                            metadatas=[_case_metadata(chunk) for chunk in batch['chunks']],
+                            embeddings=embeddings
+                        )
+                for cid in written_ids:
+                    duplicate_links.discard(cid)
+                duplicate_links.update(batch.get('duplicates', {}))
+                progress['num_embedded'] += len(batch['chunks'])
+                progress['num_duplicates'] += len(batch.get('duplicates', {}))
+                progress['duplicate_bytes'] += batch.get('duplicate_bytes', 0)
+    finally:
+        if encoder_workers > 1:
+            # Also reached when a stage fails, so worker processes never outlive the run
+            encoder.close()
+
+    # Folds the run's change logs back into the full manifest and links
+    manifest.compact()
+    duplicate_links.compact()
+
+    # Side indexes the collection changes made stale are rebuilt, whether or not they were asked for
+    stale_quantized = _stale_side_index_meta(persist_directory, 'quantized_index')
+    if quantize is None and stale_quantized is not None:
+        quantize = stale_quantized['dtype']
+    exact_index = exact_index or _stale_side_index_meta(persist_directory, 'exact_index') is not None
+
+    if quantize:
+        print(f"Building {quantize} quantized index...")
+        with journal.stage('store'):
+            index = build_quantized_index(collection, os.path.join(persist_directory, 'quantized_index'),
+                                          quantize, page_size=page_size)
+        # Stored passages double as sample queries for the recall check
+        sample = np.random.RandomState(0).choice(len(index), size=min(100, len(index)), replace=False)
+        recall = measure_recall(index, index.vectors[np.sort(sample)])
+        full_bytes = 4 * len(index) * index.dim
+        print(f"Quantized index: {index.memory_bytes / 1e6:.2f} MB in memory vs {full_bytes / 1e6:.2f} MB "
+              f"as float32; recall@10 {recall['first_pass']:.3f} first pass, "
+              f"{recall['rescored']:.3f} after exact rescoring")
+
+    if exact_index:
+        print("Building exact index...")
+        with journal.stage('store'):
+            index = build_exact_index(collection, os.path.join(persist_directory, 'exact_index'),
+                                      page_size=page_size)
+        print(f"Exact index: {len(index)} passages, {index.memory_bytes / 1e6:.2f} MB")
+
+    num_cases, num_chunks = progress['cases_done'], progress['num_chunks']
+    num_embedded, num_deleted = progress['num_embedded'], progress['num_deleted']
+    print(f"Created {num_chunks} chunks from {num_cases} cases")
+    print(f"Embedded {num_embedded} new or changed chunks, deleted {num_deleted} stale chunks")
+    if cache is not None:
+        print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses")
+    if dedup is not None:
+        seconds_per_chunk = journal.timings['embed'] / max(progress['num_embedded'], 1)
+        print(f"Near-duplicates: skipped {progress['num_duplicates']} chunks, saving "
+              f"~{progress['num_duplicates'] * seconds_per_chunk:.2f}s of embedding and "
+              f"~{progress['duplicate_bytes'] / 1e6:.2f} MB of index space")
+    print("Encoding throughput by chunk length:")
+    encoder.print_report()
+
+    print("Building citation graph...")
+    with journal.stage('graph'):
+        resolver = build_citation_resolver(case_summaries)
+        citation_csr = build_citation_csr(case_summaries, resolver)
+        citation_graph = citation_graph_from_csr(citation_csr)
+        # Near-duplicates are not stored, so they have no citations to look up
+        passage_citations = build_passage_citation_index(
+            ((cid, citations) for summary in case_summaries
+             for cid, citations in summary.get('chunk_citations', {}).items() if cid not in duplicate_links),
+            resolver
+        )
+
+        # Save citation graph, its CSR arrays and the resolver for later use. Each file is
+        # written beside its destination and swapped in, so a running app never reads half of one
+        with open('citation_graph.json.tmp', 'w') as f:
+            json.dump(citation_graph, f, indent=2)
+        os.replace('citation_graph.json.tmp', 'citation_graph.json')
+        save_citation_csr(citation_csr, 'citation_graph_csr.npz')
+        resolver.save('citation_index.json')
+        save_passage_citations(passage_citations, os.path.join(persist_directory, PASSAGE_CITATIONS_FILE))
+
+    # Last, so the app only reloads once the collection and every file beside it are final
+    version_path = os.path.join(persist_directory, INDEX_VERSION_FILE)
+    with open(version_path + '.tmp', 'w') as f:
+        json.dump({'finished': time.time(), 'count': collection.count()}, f)
+    os.replace(version_path + '.tmp', version_path)
+
+    if snapshot_directory:
+        print(f"Writing index snapshot to {snapshot_directory}...")
+        with journal.stage('store'):
+            snapshot_manifest = write_snapshot(collection, citation_csr, resolver, passage_citations,
+                                               snapshot_directory, MODEL_NAME, page_size=page_size)
+        snapshot_bytes = sum(entry['bytes'] for entry in snapshot_manifest['files'].values())
+        print(f"Snapshot: {snapshot_manifest['count']} passages, {snapshot_bytes / 1e6:.2f} MB")
+
+    journal.finish(**progress)
+    print("Time per stage (chunk/extract summed over workers):")
+    journal.print_timings()
+
+    print(f" Successfully indexed {collection.count()} passages in ChromaDB")
+    print(f"Citation graph saved to citation_graph.json, resolver to citation_index.json")
+    print(f"Citations of {len(passage_citations)} passages saved to {PASSAGE_CITATIONS_FILE}")
 
     return collection, citation_graph
 
 if __name__ == "__main__":
-    prepare_and_store_data()
+    parser = argparse.ArgumentParser(description="Prepare legal cases for semantic search")
+    parser.add_argument('--source', default=None,
+                        help="JSONL file, CSV file or directory of opinions (default: sample dataset)")
+    parser.add_argument('--persist-directory', default="./chromadb")
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processes used for chunking and citation extraction")
+    parser.add_argument('--full-rebuild', action='store_true',
+                        help="Drop the existing collection and re-embed every chunk")
+    parser.add_argument('--embedding-cache', default="./embedding_cache",
+                        help="Directory of the on-disk embedding cache")
+    parser.add_argument('--no-embedding-cache', action='store_true')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help="Maximum number of chunks per collection write")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its last checkpoint")
+    parser.add_argument('--checkpoint-interval', type=float, default=60.0,
+                        help="Minimum seconds between progress checkpoints")
+    parser.add_argument('--queue-size', type=int, default=2,
+                        help="Maximum batches buffered between pipeline stages")
+    parser.add_argument('--chunking', choices=CHUNKING_MODES, default='words',
+                        help="Fixed word windows, windows filling the encoder's token budget, "
+                             "or passages cut on sentence and paragraph boundaries")
+    parser.add_argument('--dedup-threshold', type=float, default=None,
+                        help="Skip chunks at least this similar (MinHash Jaccard estimate, e.g. 0.8) "
+                             "to an earlier chunk")
+    parser.add_argument('--quantize', choices=QUANTIZED_DTYPES, default=None,
+                        help="Also build a float16 or int8 quantized index for search")
+    parser.add_argument('--exact-index', action='store_true',
+                        help="Also build the exact in-memory index (app: SEARCH_BACKEND=exact)")
+    parser.add_argument('--encoder-backend', choices=ENCODER_BACKENDS, default='torch',
+                        help="Run the sentence encoder with PyTorch or ONNX Runtime")
+    parser.add_argument('--onnx-quantized', action='store_true',
+                        help="Use the dynamically int8-quantized ONNX model")
+    parser.add_argument('--encoder-workers', type=int, default=1,
+                        help="Processes used for encoding; each batch is split across them")
+    parser.add_argument('--encoder-threads', type=int, default=None,
+                        help="torch (or onnxruntime) threads per encoder process")
+    parser.add_argument('--snapshot', default=None, metavar='DIRECTORY',
+                        help="Also write a portable index snapshot the app can boot from")
+    args = parser.parse_args()
+    prepare_and_store_data(args.persist_directory, source=args.source,
+                           batch_size=args.batch_size, workers=args.workers,
+                           full_rebuild=args.full_rebuild,
+                           cache_directory=None if args.no_embedding_cache else args.embedding_cache,
+                           page_size=args.page_size, resume=args.resume,
+                           checkpoint_interval=args.checkpoint_interval,
+                           queue_size=args.queue_size, chunking=args.chunking,
+                           dedup_threshold=args.dedup_threshold, quantize=args.quantize,
+                           exact_index=args.exact_index,
+                           encoder_backend=args.encoder_backend, onnx_quantized=args.onnx_quantized,
+                           encoder_workers=args.encoder_workers, encoder_threads=args.encoder_threads,
+                           snapshot_directory=args.snapshot)
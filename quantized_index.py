@@ -0,0 +1,208 @@
+"""
+Quantized in-memory vector index for passage search.
+Keeps float16 or int8 codes of every passage embedding in memory for a fast first pass,
+and rescores the best candidates exactly against full-precision vectors memory-mapped from disk.
+"""
+
+import json
+import os
+import shutil
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from exact_index import exact_top_k
+
+QUANTIZED_DTYPES = ('float16', 'int8')
+
+# Candidates rescored exactly per requested result
+DEFAULT_OVERSAMPLE = 4
+
+# Rows of codes widened to float32 at a time, bounding the first pass's scratch memory
+BLOCK_ROWS = 8192
+
+class QuantizedIndex:
+    """
+    Passage embeddings as quantized codes plus a full-precision copy on disk.
+
+    Distances are squared L2, matching the collection's default space, so
+    results rank and score the same as a collection query. Files, all inside
+    one directory:
+        meta.json    dtype, count and dimension
+        ids.json     chunk ID of each row
+        codes.npy    float16 values, or int8 codes scaled per dimension
+        scales.npy   per-dimension int8 scale (float32; ones for float16)
+        norms.npy    exact squared norm of each vector (float32)
+        vectors.f32  full-precision vectors, memory-mapped for rescoring
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        self.dtype = meta['dtype']
+        self.dim = meta['dim']
+        with open(os.path.join(directory, 'ids.json'), 'r') as f:
+            self.ids = json.load(f)
+        self.codes = np.load(os.path.join(directory, 'codes.npy'))
+        self.scales = np.load(os.path.join(directory, 'scales.npy'))
+        self.norms = np.load(os.path.join(directory, 'norms.npy'))
+        self.vectors = _open_vectors(directory, len(self.ids), self.dim)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes held in memory by the first-pass arrays."""
+        return self.codes.nbytes + self.scales.nbytes + self.norms.nbytes
+
+    def approximate_distances(self, query: np.ndarray) -> np.ndarray:
+        """Squared L2 distance from query to every row, computed from the codes."""
+        query = np.asarray(query, dtype=np.float32)
+        scaled_query = query * self.scales
+        dots = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            dots[start:start + BLOCK_ROWS] = block @ scaled_query
+        return self.norms - 2 * dots + float(np.dot(query, query))
+
+    def search(self, query: np.ndarray, n_results: int = 5,
+               oversample: int = DEFAULT_OVERSAMPLE) -> Tuple[List[str], List[float]]:
+        """
+        Find the nearest passages to a query embedding.
+
+        A first pass over the quantized codes keeps n_results * oversample
+        candidates, which are then rescored against the full-precision vectors.
+
+        Returns:
+            (chunk IDs, squared L2 distances), nearest first
+        """
+        rows, distances = self._search_rows(query, n_results, oversample)
+        return [self.ids[i] for i in rows], distances.tolist()
+
+    def _search_rows(self, query: np.ndarray, n_results: int,
+                     oversample: int) -> Tuple[np.ndarray, np.ndarray]:
+        n_results = min(n_results, len(self))
+        if n_results == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).ravel()
+        approximate = self.approximate_distances(query)
+
+        num_candidates = min(n_results * max(oversample, 1), len(self))
+        if num_candidates < len(self):
+            candidates = np.argpartition(approximate, num_candidates - 1)[:num_candidates]
+        else:
+            candidates = np.arange(len(self))
+        # Sorted rows read the memmap sequentially
+        candidates.sort()
+        exact = np.sum((self.vectors[candidates] - query) ** 2, axis=1)
+
+        order = np.argsort(exact, kind='stable')[:n_results]
+        return candidates[order], exact[order]
+
+def _open_vectors(directory: str, count: int, dim: int) -> np.ndarray:
+    # np.memmap cannot map an empty file
+    if count == 0:
+        return np.zeros((0, dim), dtype=np.float32)
+    return np.memmap(os.path.join(directory, 'vectors.f32'), dtype=np.float32, mode='r', shape=(count, dim))
+
+def _quantize(vectors: np.ndarray, dtype: str, scales: np.ndarray) -> np.ndarray:
+    if dtype == 'float16':
+        return vectors.astype(np.float16)
+    return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+
+def build_quantized_index(collection, directory: str, dtype: str = 'int8',
+                          page_size: int = 1000) -> QuantizedIndex:
+    """
+    Build a quantized index of every embedding in a collection.
+
+    Embeddings are paged out of the collection into an on-disk float32 file,
+    so the full-precision index never has to fit in memory. The new index
+    replaces any previous one once it is complete.
+
+    Args:
+        collection: ChromaDB collection to index
+        directory: Directory the index is written to
+        dtype: 'float16', or 'int8' with per-dimension scales
+        page_size: Number of embeddings read from the collection at a time
+
+    Returns:
+        The loaded index
+    """
+    if dtype not in QUANTIZED_DTYPES:
+        raise ValueError(f"Unknown quantized dtype: {dtype} (expected one of {QUANTIZED_DTYPES})")
+    tmp_directory = directory + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    ids = []
+    dim = None
+    with open(os.path.join(tmp_directory, 'vectors.f32'), 'wb') as f:
+        for offset in range(0, collection.count(), page_size):
+            page = collection.get(offset=offset, limit=page_size, include=['embeddings'])
+            embeddings = np.asarray(page['embeddings'], dtype=np.float32)
+            dim = embeddings.shape[1]
+            ids.extend(page['ids'])
+            f.write(embeddings.tobytes())
+    dim = dim or 0
+
+    vectors = _open_vectors(tmp_directory, len(ids), dim)
+    # Per-dimension scales map each dimension's largest magnitude to 127
+    scales = np.ones(dim, dtype=np.float32)
+    if dtype == 'int8' and ids:
+        max_abs = np.zeros(dim, dtype=np.float32)
+        for start in range(0, len(ids), page_size):
+            np.maximum(max_abs, np.abs(vectors[start:start + page_size]).max(axis=0), out=max_abs)
+        scales = np.where(max_abs > 0, max_abs / 127, 1).astype(np.float32)
+
+    codes = np.empty((len(ids), dim), dtype=np.float16 if dtype == 'float16' else np.int8)
+    norms = np.empty(len(ids), dtype=np.float32)
+    for start in range(0, len(ids), page_size):
+        block = np.asarray(vectors[start:start + page_size])
+        codes[start:start + page_size] = _quantize(block, dtype, scales)
+        norms[start:start + page_size] = np.einsum('ij,ij->i', block, block)
+    del vectors
+
+    np.save(os.path.join(tmp_directory, 'codes.npy'), codes)
+    np.save(os.path.join(tmp_directory, 'scales.npy'), scales)
+    np.save(os.path.join(tmp_directory, 'norms.npy'), norms)
+    with open(os.path.join(tmp_directory, 'ids.json'), 'w') as f:
+        json.dump(ids, f)
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as f:
+        json.dump({'dtype': dtype, 'count': len(ids), 'dim': dim}, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return QuantizedIndex(directory)
+
+def load_quantized_index(directory: str) -> Optional[QuantizedIndex]:
+    """Load a quantized index, or None if none has been built."""
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        return None
+    return QuantizedIndex(directory)
+
+def measure_recall(index: QuantizedIndex, queries: np.ndarray, n_results: int = 10,
+                   oversample: int = DEFAULT_OVERSAMPLE) -> Dict[str, float]:
+    """
+    Recall of quantized search against exact search over the full-precision vectors.
+
+    Returns:
+        {'first_pass': recall@n_results of the quantized scores alone,
+         'rescored': recall@n_results after exact rescoring of the candidates}
+    """
+    n_results = min(n_results, len(index))
+    if n_results == 0 or len(queries) == 0:
+        return {'first_pass': 1.0, 'rescored': 1.0}
+    queries = np.asarray(queries, dtype=np.float32)
+    # Expanded over the stored norms and read in blocks, never an (N, dim) difference per query
+    all_truth, _ = exact_top_k(index.vectors, index.norms, queries, n_results)
+    first_pass = rescored = 0
+    for query, truth in zip(queries, all_truth):
+        truth = set(truth.tolist())
+        approximate = np.argsort(index.approximate_distances(query), kind='stable')[:n_results]
+        first_pass += len(truth & set(approximate.tolist()))
+        rows, _ = index._search_rows(query, n_results, oversample)
+        rescored += len(truth & set(rows.tolist()))
+    total = n_results * len(queries)
+    return {'first_pass': first_pass / total, 'rescored': rescored / total}
@@ -0,0 +1,139 @@
+"""
+Dynamic micro-batching of query encodings.
+Collects queries that arrive from concurrent requests within a few milliseconds of each other and
+encodes them in one call, so the encoder runs full batches instead of many batches of one.
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from typing import List, Dict
+
+import numpy as np
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT_MS = 5.0
+
+# Queue waits kept for the percentiles
+WAIT_SAMPLES = 10000
+
+class MicroBatchEncoder:
+    """
+    Batching front end for a sentence encoder shared by request threads.
+
+    encode() enqueues its texts and blocks until they are embedded. A single
+    worker thread takes the first waiting text and, if others are already
+    queued behind it, gathers more until max_batch_size are waiting or
+    max_wait_ms has passed since the first arrived; a text queued alone is
+    encoded at once. It then encodes the batch in one call and hands each
+    caller its own vectors. Only this thread calls the model, so concurrent requests never
+    contend for the encoder's threads.
+    """
+
+    def __init__(self, encoder, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS):
+        """
+        Args:
+            encoder: Sentence encoder with a SentenceTransformer-style encode()
+            max_batch_size: Most texts encoded in one call
+            max_wait_ms: Longest a text waits for others to join its batch
+        """
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._batch_sizes = Counter()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='query-batcher', daemon=True)
+        self._thread.start()
+
+    def encode(self, texts: List[str], **_) -> np.ndarray:
+        """Embed texts (float32, one row per text), batched with other callers' texts."""
+        futures = []
+        for text in texts:
+            future = Future()
+            self._queue.put((text, future, time.perf_counter()))
+            futures.append(future)
+        return np.stack([future.result() for future in futures])
+
+    def _next_batch(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Waiting only pays off under concurrent load, so a lone text never waits
+                if len(batch) > 1 and remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+            started = time.perf_counter()
+            with self._lock:
+                self._waits.extend(started - enqueued for _, _, enqueued in batch)
+                self._batch_sizes[len(batch)] += 1
+            try:
+                embeddings = np.asarray(self.encoder.encode([text for text, _, _ in batch]), dtype=np.float32)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
+    def close(self):
+        """Stop the worker thread once the texts already queued are encoded."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> Dict:
+        """
+        Queue wait percentiles and the batch-size histogram.
+
+        Returns:
+            {'batches', 'texts', 'mean_batch_size', 'wait_p50_ms', 'wait_p99_ms',
+             'batch_sizes': {size: number of batches}}
+        """
+        with self._lock:
+            waits = np.asarray(self._waits, dtype=np.float64) * 1000
+            batch_sizes = dict(sorted(self._batch_sizes.items()))
+        batches = sum(batch_sizes.values())
+        texts = sum(size * count for size, count in batch_sizes.items())
+        return {
+            'batches': batches,
+            'texts': texts,
+            'mean_batch_size': texts / batches if batches else 0.0,
+            'wait_p50_ms': float(np.percentile(waits, 50)) if len(waits) else 0.0,
+            'wait_p99_ms': float(np.percentile(waits, 99)) if len(waits) else 0.0,
+            'batch_sizes': batch_sizes
+        }
+
+    def print_report(self):
+        """Print the batch-size histogram and queue wait percentiles."""
+        stats = self.stats()
+        print(f"{stats['texts']} queries in {stats['batches']} batches "
+              f"(mean {stats['mean_batch_size']:.1f}); queue wait p50 {stats['wait_p50_ms']:.2f} ms, "
+              f"p99 {stats['wait_p99_ms']:.2f} ms")
+        widest = max(stats['batch_sizes'].values(), default=0)
+        for size, count in stats['batch_sizes'].items():
+            bar = '#' * max(1, round(40 * count / widest))
+            print(f"  {size:>4} {count:>8}  {bar}")
@@ -0,0 +1,251 @@
+"""
+In-process caches for the search path.
+Keeps the embeddings of recent queries so repeated searches skip the sentence encoder, and the
+finished results of recent searches, invalidated whenever the index they were computed from changes.
+"""
+
+import os
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_QUERY_CACHE_SIZE = 1024
+
+# Result cache defaults: entry lifetime, memory budget, and how often the index version is re-checked
+DEFAULT_RESULT_CACHE_TTL = 300.0
+DEFAULT_RESULT_CACHE_BYTES = 64 * 1024 * 1024
+VERSION_CHECK_INTERVAL = 1.0
+
+def normalize_query(query: str, lowercase: bool = True) -> str:
+    """Canonical form of a query: Unicode-normalized, whitespace-collapsed and (for uncased models) lowercased."""
+    query = ' '.join(unicodedata.normalize('NFKC', query).split())
+    return query.casefold() if lowercase else query
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings in front of a sentence encoder.
+
+    Keys are (model ID, normalized query), so queries differing only in case
+    or spacing share an entry and a cache never serves another model's
+    vectors. Safe to share between request threads; two threads missing on
+    the same query at once may both encode it.
+    """
+
+    def __init__(self, encoder, model_id: str, max_size: int = DEFAULT_QUERY_CACHE_SIZE,
+                 lowercase: bool = True):
+        """
+        Args:
+            encoder: Sentence encoder with a SentenceTransformer-style encode()
+            model_id: Identifies the model (and backend) the embeddings come from
+            max_size: Maximum number of cached queries; 0 disables caching
+            lowercase: Fold case when normalizing; set False for cased models
+        """
+        self.encoder = encoder
+        self.model_id = model_id
+        self.max_size = max_size
+        self.lowercase = lowercase
+        self._entries: 'OrderedDict[Tuple[str, str], np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def encode(self, query: str) -> np.ndarray:
+        """
+        Embedding of a single query, from the cache when possible.
+
+        Returns:
+            1-D float32 vector (read-only, as it is shared between callers)
+        """
+        key = (self.model_id, normalize_query(query, self.lowercase))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return embedding
+            self.misses += 1
+
+        embedding = np.asarray(self.encoder.encode([key[1]]), dtype=np.float32)[0]
+        embedding.flags.writeable = False
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[key] = embedding
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return embedding
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit and miss counts, hit rate and current size."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self._entries),
+            'max_size': self.max_size
+        }
+
+def file_version(paths: Iterable[str]) -> Tuple:
+    """Version stamp of a set of files: (path, mtime, size) of each one that exists."""
+    version = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        version.append((path, stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+def estimate_bytes(value: Any) -> int:
+    """Approximate memory held by a value built from dicts, lists, tuples, strings and numbers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_bytes(k) + estimate_bytes(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(estimate_bytes(item) for item in value)
+    elif isinstance(value, np.ndarray):
+        size += value.nbytes
+    return size
+
+class ResultCache:
+    """
+    Versioned cache of finished search results, with TTL and a memory bound.
+
+    Every entry is tagged with the index version it was computed from.
+    version_fn is re-read at most every check_interval seconds. When it
+    changes, all entries are dropped and on_change is called, so callers can
+    reload their own copies of the index data. Entries also expire ttl
+    seconds after they are stored. Least recently used entries are evicted
+    to keep the estimated total size under max_bytes. Thread-safe; two
+    threads missing on the same key at once both compute it.
+    """
+
+    def __init__(self, version_fn: Callable[[], Hashable], ttl: float = DEFAULT_RESULT_CACHE_TTL,
+                 max_bytes: int = DEFAULT_RESULT_CACHE_BYTES, check_interval: float = VERSION_CHECK_INTERVAL,
+                 on_change: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            version_fn: Returns the current index version (any hashable value)
+            ttl: Seconds an entry stays valid; 0 or less disables caching
+            max_bytes: Memory budget for all entries
+            check_interval: Minimum seconds between calls to version_fn
+            on_change: Called (before any lookup proceeds) when the version changes
+        """
+        self.version_fn = version_fn
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self.on_change = on_change
+        self._entries: 'OrderedDict[Hashable, Tuple[float, int, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.version = version_fn()
+        self._checked = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def check_version(self):
+        """Drop every entry if the index version changed since the last check."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return
+            self._checked = now
+            if self.version_fn() == self.version:
+                return
+            # Under the lock, so no lookup sees the new version before the reload; if the
+            # reload fails, the old version stays current and the next check retries it
+            if self.on_change is not None:
+                self.on_change()
+            # Read again: the reload may have seen (and loaded) a later version than the check did
+            self.version = self.version_fn()
+            self._entries.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _pop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Cached value of key for the current index version, or None."""
+        self.check_version()
+        with self._lock:
+            entry = self._entries.get((self.version, key))
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end((self.version, key))
+                self.hits += 1
+                return entry[2]
+            if entry is not None:
+                self._pop((self.version, key))
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, version: Optional[Hashable] = None):
+        """
+        Store a value for key under the current index version.
+
+        Args:
+            version: Version the value was computed from; if given and no
+                longer current, the value is stale and is not stored
+        """
+        size = estimate_bytes(value)
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            versioned_key = (self.version, key)
+            if versioned_key in self._entries:
+                self._pop(versioned_key)
+            self._entries[versioned_key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Cached value of key, computing and storing it on a miss."""
+        value = self.get(key)
+        if value is None:
+            version = self.version
+            value = compute()
+            self.put(key, value, version)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        """Hit, miss, eviction and invalidation counts, and current size."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes
+        }
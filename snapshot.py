@@ -0,0 +1,188 @@
+"""
+Portable, versioned snapshot of the search index.
+Packs passage embeddings (memory-mappable .npy), columnar chunk metadata (Parquet), the citation
+graph in CSR form, passage citations and the citation resolver into one directory with a checksummed manifest,
+so the app can boot from plain files instead of opening a ChromaDB directory.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import List, Dict, Optional
+
+import numpy as np
+
+from chunk_table import CHUNKS_FILE, chunk_schema, page_table
+from citations import CitationResolver
+from exact_index import TableIndex
+from passage_citations import (PASSAGE_CITATIONS_FILE, PassageCitationIndex, load_passage_citations,
+                               save_passage_citations)
+
+SNAPSHOT_FORMAT = 'semanticjury-snapshot'
+SNAPSHOT_VERSION = 2
+
+DEFAULT_SNAPSHOT_DIRECTORY = "./snapshot"
+
+def _file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_snapshot(collection, citation_csr, resolver: CitationResolver,
+                   passage_citations: PassageCitationIndex, directory: str,
+                   model_name: str, page_size: int = 1000) -> Dict:
+    """
+    Write a snapshot of a collection and its citation graph.
+
+    Embeddings and metadata are paged out of the collection, so the snapshot
+    is never held in memory whole. It is assembled next to its destination
+    and swapped in once complete.
+
+    Args:
+        collection: ChromaDB collection to snapshot
+        citation_csr: CitationCSR of the corpus
+        resolver: Citation resolver of the corpus
+        passage_citations: Citations of the stored passages
+        directory: Snapshot directory
+        model_name: Embedding model the vectors come from
+        page_size: Number of chunks read from the collection at a time
+
+    Returns:
+        The snapshot manifest
+    """
+    import pyarrow.parquet as pq
+    from prepare_data import save_citation_csr
+
+    tmp_directory = directory.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    count = collection.count()
+    embeddings = norms = None
+    with pq.ParquetWriter(os.path.join(tmp_directory, CHUNKS_FILE), chunk_schema()) as parquet:
+        for offset in range(0, count, page_size):
+            page = collection.get(offset=offset, limit=page_size,
+                                  include=['embeddings', 'metadatas', 'documents'])
+            vectors = np.asarray(page['embeddings'], dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(os.path.join(tmp_directory, 'embeddings.npy'),
+                                                       mode='w+', dtype=np.float32,
+                                                       shape=(count, vectors.shape[1]))
+                norms = np.empty(count, dtype=np.float32)
+            embeddings[offset:offset + len(vectors)] = vectors
+            norms[offset:offset + len(vectors)] = np.einsum('ij,ij->i', vectors, vectors)
+
+            parquet.write_table(page_table(page))
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(tmp_directory, 'embeddings.npy'), embeddings)
+        norms = np.zeros(0, dtype=np.float32)
+    else:
+        embeddings.flush()
+    np.save(os.path.join(tmp_directory, 'norms.npy'), norms)
+    dim = int(embeddings.shape[1])
+    del embeddings
+
+    save_citation_csr(citation_csr, os.path.join(tmp_directory, 'citation_graph.npz'))
+    resolver.save(os.path.join(tmp_directory, 'citation_index.json'))
+    save_passage_citations(passage_citations, os.path.join(tmp_directory, PASSAGE_CITATIONS_FILE))
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'model_name': model_name,
+        'count': count,
+        'dim': dim,
+        'files': {}
+    }
+    for name in sorted(os.listdir(tmp_directory)):
+        path = os.path.join(tmp_directory, name)
+        manifest['files'][name] = {'bytes': os.path.getsize(path), 'sha256': _file_checksum(path)}
+    with open(os.path.join(tmp_directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_directory, directory)
+    return manifest
+
+def verify_snapshot(directory: str) -> List[str]:
+    """
+    Check every file of a snapshot against its manifest checksum.
+
+    Returns:
+        Names of missing or corrupted files (empty if the snapshot is intact)
+    """
+    with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+        manifest = json.load(f)
+    bad = []
+    for name, expected in manifest['files'].items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or _file_checksum(path) != expected['sha256']:
+            bad.append(name)
+    return bad
+
+def snapshot_exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, 'manifest.json'))
+
+class IndexSnapshot(TableIndex):
+    """
+    Read-only index served straight from a snapshot directory.
+
+    Embeddings are memory-mapped and the Parquet metadata is read through a
+    memory map, so opening is cheap and pages are loaded on first touch.
+    Serves the app in place of the collection (see TableIndex).
+    """
+
+    def __init__(self, directory: str):
+        """
+        Open a snapshot, checking its format, version and file sizes.
+
+        Checksums are not recomputed here; see verify_snapshot().
+
+        Raises:
+            ValueError: If the directory is not a compatible, complete snapshot
+        """
+        import pyarrow.parquet as pq
+        from prepare_data import load_citation_csr
+
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json'), 'r') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != SNAPSHOT_FORMAT or self.manifest.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot {self.manifest.get('format')} "
+                             f"version {self.manifest.get('version')} in {directory}")
+        for name, expected in self.manifest['files'].items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path) or os.path.getsize(path) != expected['bytes']:
+                raise ValueError(f"Snapshot file {name} is missing or truncated in {directory}")
+
+        self.embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+        self.norms = np.load(os.path.join(directory, 'norms.npy'))
+        self.table = pq.read_table(os.path.join(directory, CHUNKS_FILE), memory_map=True)
+        self.citation_csr = load_citation_csr(os.path.join(directory, 'citation_graph.npz'))
+        self.resolver = CitationResolver.load(os.path.join(directory, 'citation_index.json'))
+        self.passage_citations = load_passage_citations(os.path.join(directory, PASSAGE_CITATIONS_FILE))
+
+def load_snapshot(directory: str = DEFAULT_SNAPSHOT_DIRECTORY) -> Optional[IndexSnapshot]:
+    """Open the snapshot in a directory, or None if there is none."""
+    if not snapshot_exists(directory):
+        return None
+    return IndexSnapshot(directory)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Verify an index snapshot")
+    parser.add_argument('directory', nargs='?', default=DEFAULT_SNAPSHOT_DIRECTORY)
+    args = parser.parse_args()
+
+    bad = verify_snapshot(args.directory)
+    if bad:
+        print(f"Snapshot {args.directory} is corrupted: {', '.join(bad)}")
+        raise SystemExit(1)
+    print(f"Snapshot {args.directory} is intact")
@@ -0,0 +1,166 @@
+"""
+Synthetic legal corpus generator for scale testing.
+Produces any number of opinions built from the sample dataset's prose, with log-normal lengths
+and a cross-citation graph that favors older, landmark cases, streamed one case at a time.
+"""
+
+import json
+import math
+import random
+from typing import List, Dict, Iterator, Tuple
+
+from chunking import sentence_spans
+from citations import find_citations
+from prepare_data import create_sample_legal_dataset
+
+# Reporters synthetic cases are published in, with their share of cases
+SYNTHETIC_REPORTERS = (('U.S.', 0.2), ('F.2d', 0.25), ('F.3d', 0.25), ('F. Supp. 2d', 0.2), ('A.2d', 0.1))
+
+PARTY_NAMES = [
+    'Adams', 'Baker', 'Carter', 'Davis', 'Ellis', 'Foster', 'Garcia', 'Hughes', 'Irving', 'Jensen',
+    'Keller', 'Lopez', 'Morgan', 'Nash', 'Owens', 'Parker', 'Quinn', 'Reyes', 'Sullivan', 'Turner',
+    'United States', 'State', 'Board of Education', 'City of Springfield', 'County Commission',
+    'Acme Corp.', 'National Bank', 'Regents', 'Department of Labor', 'Commonwealth',
+]
+
+# Cases per reporter volume, so volume/page pairs stay unique up to millions of cases
+CASES_PER_VOLUME = 1000
+
+def _first_synthetic_volume() -> int:
+    """First volume above every citation of the sample cases, so synthetic citations never collide with them."""
+    volumes = []
+    for case in create_sample_legal_dataset():
+        volumes.append(int(case['citation'].split()[0]))
+        volumes.extend(int(match.volume) for match in find_citations(case['text']))
+    return max(volumes) + 1
+
+def _sentence_pool() -> List[str]:
+    """Sentences of the sample opinions that carry no citation of their own."""
+    sentences = []
+    for case in create_sample_legal_dataset():
+        for start, end, _ in sentence_spans(case['text']):
+            sentence = case['text'][start:end]
+            if not find_citations(sentence):
+                sentences.append(sentence)
+    return sentences
+
+class SyntheticCorpus:
+    """
+    Deterministic generator of N synthetic cases.
+
+    The sample cases come first, unchanged; every later case gets a unique
+    reporter citation and a year that grows with its index, and cites earlier
+    cases (skewed toward the oldest, the way landmark decisions accumulate
+    citations) plus the occasional sample case. Case i is the same for a
+    given seed no matter how many cases are generated.
+    """
+
+    def __init__(self, num_cases: int, seed: int = 42, median_words: int = 2500,
+                 length_sigma: float = 0.8, citations_per_1000_words: float = 4.0,
+                 length_scale: float = 1.0):
+        """
+        Args:
+            num_cases: Total number of cases, sample cases included
+            seed: Random seed
+            median_words: Median opinion length in words
+            length_sigma: Sigma of the log-normal length distribution
+            citations_per_1000_words: Mean citation density
+            length_scale: Multiplier on every length, to shrink runs at 10^6 cases
+        """
+        self.num_cases = num_cases
+        self.seed = seed
+        self.median_words = median_words * length_scale
+        self.length_sigma = length_sigma
+        self.citations_per_1000_words = citations_per_1000_words
+        self.sample_cases = create_sample_legal_dataset()[:num_cases]
+        self.sentences = _sentence_pool()
+        self._first_volume = _first_synthetic_volume()
+        self._mean_sentence_words = sum(len(s.split()) for s in self.sentences) / len(self.sentences)
+        reporters, weights = zip(*SYNTHETIC_REPORTERS)
+        self._reporters = reporters
+        self._cumulative_weights = [sum(weights[:i + 1]) for i in range(len(weights))]
+
+    def __len__(self) -> int:
+        return self.num_cases
+
+    def identity(self, index: int) -> Tuple[str, str, str, int]:
+        """(case_id, case_name, citation, year) of the synthetic case at index."""
+        rng = random.Random(self.seed * 1_000_003 + index)
+        reporter = rng.choices(self._reporters, cum_weights=self._cumulative_weights)[0]
+        volume = self._first_volume + index // CASES_PER_VOLUME
+        page = 1 + index % CASES_PER_VOLUME
+        year = 1850 + int(170 * index / max(self.num_cases, 1))
+        plaintiff, defendant = rng.sample(PARTY_NAMES, 2)
+        citation = f"{volume} {reporter} {page}"
+        return f"synthetic_{index:07d}", f"{plaintiff} v. {defendant}", citation, year
+
+    def _cited_index(self, rng: random.Random, index: int) -> int:
+        # Squaring a uniform draw favors the oldest cases
+        return int((rng.random() ** 2) * index)
+
+    def case(self, index: int) -> Dict:
+        """The case at index."""
+        if index < len(self.sample_cases):
+            return dict(self.sample_cases[index])
+
+        case_id, case_name, citation, year = self.identity(index)
+        rng = random.Random(self.seed * 7_919 + index)
+        target_words = max(50, int(rng.lognormvariate(math.log(self.median_words), self.length_sigma)))
+        # Chance that a sentence is a citation, giving the target density on average
+        citation_rate = self.citations_per_1000_words * self._mean_sentence_words / 1000
+
+        paragraphs, sentences, words = [], [], 0
+        while words < target_words:
+            if rng.random() < citation_rate:
+                if index > len(self.sample_cases) and rng.random() < 0.9:
+                    _, cited_name, cited_citation, cited_year = self.identity(
+                        max(self._cited_index(rng, index), len(self.sample_cases)))
+                else:
+                    sample = rng.choice(self.sample_cases)
+                    cited_name = sample['case_name'].split(',')[0]
+                    cited_citation, cited_year = sample['citation'], sample['year']
+                sentence = f"See {cited_name}, {cited_citation} ({cited_year})."
+            else:
+                sentence = rng.choice(self.sentences)
+            sentences.append(sentence)
+            words += len(sentence.split())
+            if len(sentences) >= rng.randint(4, 8):
+                paragraphs.append(' '.join(sentences))
+                sentences = []
+        if sentences:
+            paragraphs.append(' '.join(sentences))
+
+        return {
+            'case_id': case_id,
+            'case_name': f"{case_name}, {citation} ({year})",
+            'citation': citation,
+            'year': year,
+            'court': 'Supreme Court' if ' U.S. ' in citation else 'Federal Court',
+            'text': '\n\n'.join(paragraphs)
+        }
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(self.num_cases):
+            yield self.case(index)
+
+def write_jsonl(corpus: SyntheticCorpus, path: str):
+    """Write a synthetic corpus as JSONL, the format prepare_data.py --source reads."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for case in corpus:
+            f.write(json.dumps(case, ensure_ascii=False) + '\n')
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic legal corpus")
+    parser.add_argument('--cases', type=int, default=1000)
+    parser.add_argument('--output', default='synthetic_cases.jsonl')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--median-words', type=int, default=2500)
+    parser.add_argument('--citations-per-1000-words', type=float, default=4.0)
+    args = parser.parse_args()
+
+    write_jsonl(SyntheticCorpus(args.cases, seed=args.seed, median_words=args.median_words,
+                                citations_per_1000_words=args.citations_per_1000_words),
+                args.output)
+    print(f"Wrote {args.cases} cases to {args.output}")
@@ -0,0 +1,54 @@
+import numpy as np
+
+from encoding import EmbeddingCache
+
+DIM = 4
+
+def _vector(value: float) -> np.ndarray:
+    return np.full((1, DIM), value, dtype=np.float32)
+
+def test_cache_survives_torn_append(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    cache.add(['a', 'b'], np.concatenate([_vector(1), _vector(2)]))
+
+    # Crash after the digest of 'c' was appended but before its vector was
+    with open(cache._digests_path, 'ab') as f:
+        f.write(EmbeddingCache.digest('c'))
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    _, misses = cache.lookup(['c'])
+    assert misses == [0]
+    cache.add(['d'], _vector(4))
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    embeddings, misses = cache.lookup(['a', 'b', 'c', 'd'])
+    assert misses == [2]
+    np.testing.assert_array_equal(embeddings[[0, 1, 3], 0], [1, 2, 4])
+
+def test_cache_drops_partial_vector_row(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    cache.add(['a'], _vector(1))
+    with open(cache._vectors_path, 'ab') as f:
+        f.write(b'\x00' * 6)
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    cache.add(['b'], _vector(2))
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    embeddings, misses = cache.lookup(['a', 'b'])
+    assert misses == []
+    np.testing.assert_array_equal(embeddings[:, 0], [1, 2])
+
+def test_cache_drops_vectors_of_torn_first_append(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    # Crash after the first vectors were appended but before any digest was
+    with open(cache._vectors_path, 'ab') as f:
+        f.write(np.concatenate([_vector(1), _vector(2)]).astype(cache.dtype).tobytes())
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    cache.add(['a'], _vector(3))
+
+    cache = EmbeddingCache(str(tmp_path), 'test-model', DIM)
+    embeddings, misses = cache.lookup(['a'])
+    assert misses == []
+    np.testing.assert_array_equal(embeddings[:, 0], [3])
@@ -0,0 +1,57 @@
+import json
+import os
+
+from change_log import ChangeLog
+from dedup import DuplicateLinks
+from index_manifest import IndexManifest
+
+def _chunks(case_id, *texts):
+    return [{'case_id': case_id, 'chunk_index': i, 'text': text} for i, text in enumerate(texts)]
+
+def test_checkpoints_append_only_changed_cases(tmp_path):
+    path = str(tmp_path / 'index_manifest.json')
+    manifest = IndexManifest.load(path)
+    for case_id in ('a', 'b'):
+        manifest.update_case(case_id, _chunks(case_id, 'one', 'two'))
+    manifest.compact()
+
+    manifest = IndexManifest.load(path)
+    manifest.update_case('a', _chunks('a', 'one', 'changed'))
+    manifest.update_case('b', _chunks('b', 'one', 'two'))
+    manifest.save()
+    with open(manifest._log.path) as f:
+        assert [json.loads(line)[0] for line in f] == ['a']
+
+    reloaded = IndexManifest.load(path)
+    assert reloaded.cases == manifest.cases
+    reloaded.mark_seen(['a'])
+    assert reloaded.remove_unseen_cases() == ['b_chunk_0', 'b_chunk_1']
+    reloaded.save()
+    assert set(IndexManifest.load(path).cases) == {'a'}
+
+    reloaded.compact()
+    assert not os.path.exists(reloaded._log.path)
+    assert set(IndexManifest.load(path).cases) == {'a'}
+
+def test_change_log_drops_torn_record(tmp_path):
+    log = ChangeLog(str(tmp_path / 'links.log.jsonl'))
+    log.append({'x': 'y'})
+    with open(log.path, 'a') as f:
+        f.write('["z", "canon')
+
+    assert log.replay({}) == {'x': 'y'}
+    log.append({'w': 'y', 'x': None})
+    assert log.replay({}) == {'w': 'y'}
+
+def test_duplicate_links_round_trip(tmp_path):
+    path = str(tmp_path / 'duplicate_links.json')
+    links = DuplicateLinks.load(path)
+    links.update({'b_chunk_0': 'a_chunk_0', 'c_chunk_0': 'a_chunk_0'})
+    links.save()
+    links.discard('c_chunk_0')
+    links.save()
+
+    reloaded = DuplicateLinks.load(path)
+    assert reloaded.links == {'b_chunk_0': 'a_chunk_0'}
+    reloaded.compact()
+    assert DuplicateLinks.load(path).links == {'b_chunk_0': 'a_chunk_0'}
@@ -0,0 +1,87 @@
+import json
+
+import chromadb
+import pytest
+from chromadb.config import Settings
+
+import prepare_data
+from dedup import DuplicateLinks
+from exact_index import load_exact_index
+from benchmark import StubEncoder
+
+@pytest.fixture
+def ingest(tmp_path, monkeypatch):
+    """Run prepare_and_store_data on a list of cases with the stub encoder."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(prepare_data, 'load_encoder', lambda *args, **kwargs: StubEncoder())
+    persist_directory = str(tmp_path / 'chromadb')
+
+    def run(cases, **options):
+        source = tmp_path / 'cases.jsonl'
+        source.write_text(''.join(json.dumps(case) + '\n' for case in cases))
+        prepare_data.prepare_and_store_data(persist_directory=persist_directory, source=str(source),
+                                            cache_directory=None, dedup_threshold=0.8, **options)
+        client = chromadb.Client(Settings(anonymized_telemetry=False, persist_directory=persist_directory,
+                                          is_persistent=True))
+        return client.get_collection('legal_cases')
+
+    return run
+
+@pytest.fixture
+def cases():
+    sample = prepare_data.create_sample_legal_dataset()
+    brown = sample[0]
+    return brown, dict(brown, case_id='brown_copy'), sample[1:]
+
+def test_duplicate_is_stored_when_its_canonical_case_is_removed(ingest, cases):
+    brown, brown_copy, others = cases
+    collection = ingest([brown, brown_copy] + others)
+    assert collection.get(where={'case_id': 'brown_copy'})['ids'] == []
+
+    collection = ingest([brown_copy] + others)
+    stored = collection.get(where={'case_id': 'brown_copy'}, include=['documents'])
+    assert stored['documents'] == [brown['text']]
+    assert collection.count() == len(others) + 1
+
+def test_duplicate_is_stored_when_its_canonical_chunk_changes(ingest, cases):
+    brown, brown_copy, others = cases
+    ingest([brown, brown_copy] + others)
+
+    rewritten = dict(brown, text='An entirely different opinion about something else altogether.')
+    collection = ingest([rewritten, brown_copy] + others)
+    stored = collection.get(where={'case_id': 'brown_copy'}, include=['documents'])
+    assert stored['documents'] == [brown['text']]
+    assert collection.count() == len(others) + 2
+
+def test_side_index_is_rebuilt_when_the_collection_changes(ingest, cases, tmp_path):
+    brown, brown_copy, others = cases
+    ingest([brown] + others, exact_index=True)
+    directory = str(tmp_path / 'chromadb' / 'exact_index')
+    assert len(load_exact_index(directory)) == len(others) + 1
+
+    ingest(others)
+    index = load_exact_index(directory)
+    assert len(index) == len(others)
+    assert not any(cid.startswith(brown['case_id']) for cid in index.ids)
+
+def test_resume_keeps_links_of_duplicates_it_skips(ingest, cases, tmp_path, monkeypatch):
+    brown, brown_copy, others = cases
+    write = prepare_data.PagedCollectionWriter.write
+    calls = []
+
+    def failing_write(self, *args, **kwargs):
+        calls.append(None)
+        if len(calls) == 3:
+            raise RuntimeError('interrupted')
+        return write(self, *args, **kwargs)
+
+    # One case per batch and no checkpoint before the interruption, on the third write
+    monkeypatch.setattr(prepare_data.PagedCollectionWriter, 'write', failing_write)
+    with pytest.raises(RuntimeError):
+        ingest([brown, brown_copy] + others, batch_size=1)
+    monkeypatch.setattr(prepare_data.PagedCollectionWriter, 'write', write)
+
+    collection = ingest([brown, brown_copy] + others, batch_size=1, resume=True)
+    assert collection.get(where={'case_id': 'brown_copy'})['ids'] == []
+    links = DuplicateLinks.load(str(tmp_path / 'chromadb' / 'duplicate_links.json'))
+    assert links.links == {'brown_copy_chunk_0': f"{brown['case_id']}_chunk_0"}
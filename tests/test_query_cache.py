@@ -0,0 +1,39 @@
+import pytest
+
+from query_cache import ResultCache
+
+def test_failed_reload_keeps_the_old_version():
+    state = {'version': 1, 'fail': True, 'reloads': 0}
+
+    def reload():
+        state['reloads'] += 1
+        if state['fail']:
+            raise OSError("index is being rewritten")
+
+    cache = ResultCache(lambda: state['version'], check_interval=0, on_change=reload)
+    cache.put('query', ['result'])
+
+    state['version'] = 2
+    with pytest.raises(OSError):
+        cache.get('query')
+    assert cache.version == 1
+
+    state['fail'] = False
+    assert cache.get('query') is None
+    assert cache.version == 2
+    assert state['reloads'] == 2
+
+def test_version_is_read_after_the_reload():
+    state = {'version': 1}
+
+    def reload():
+        # A run finishes while the reload is in progress
+        state['version'] = 3
+
+    cache = ResultCache(lambda: state['version'], check_interval=0, on_change=reload)
+    state['version'] = 2
+    cache.get('query')
+    assert cache.version == 3
+    cache.put('query', ['result'])
+    assert cache.get('query') == ['result']
+    assert cache.invalidations == 1
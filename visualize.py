@@ -9,12 +9,24 @@ from sklearn.manifold import TSNE
 from sklearn.decomposition import PCA
 import chromadb
 from chromadb.config import Settings
-from sentence_transformers import SentenceTransformer
 import json
+import os
+from exact_index import load_exact_index
+from snapshot import DEFAULT_SNAPSHOT_DIRECTORY, load_snapshot
+
+# Plots read the index snapshot when there is one, like the app, and the exact index with SEARCH_BACKEND=exact
+SNAPSHOT_DIRECTORY = os.environ.get('SNAPSHOT_DIRECTORY', DEFAULT_SNAPSHOT_DIRECTORY)
 
 def load_embeddings_and_metadata():
-    """Load all embeddings and metadata from ChromaDB."""
+    """Load all embeddings and metadata from the index snapshot, the exact index, or else ChromaDB."""
     persist_directory = "./chromadb"
+    index = load_snapshot(SNAPSHOT_DIRECTORY)
+    if index is None and os.environ.get('SEARCH_BACKEND') == 'exact':
+        index = load_exact_index(os.path.join(persist_directory, 'exact_index'))
+    if index is not None:
+        results = index.get(include=['embeddings', 'metadatas', 'documents'])
+        return np.asarray(results['embeddings'], dtype=np.float32), results['metadatas'], results['documents']
+
     client = chromadb.Client(Settings(
         anonymized_telemetry=False,
         persist_directory=persist_directory,
@@ -25,7 +37,7 @@ def load_embeddings_and_metadata():
     # Get all documents
     results = collection.get(include=['embeddings', 'metadatas', 'documents'])
 
-    embeddings = np.array(results['embeddings'])
+    embeddings = np.asarray(results['embeddings'], dtype=np.float32)
     metadatas = results['metadatas']
     documents = results['documents']
 
@@ -129,8 +141,13 @@ def create_citation_network_plot():
         Plotly figure object
     """
     print("Loading citation graph...")
-    with open('citation_graph.json', 'r') as f:
-        citation_graph = json.load(f)
+    snapshot = load_snapshot(SNAPSHOT_DIRECTORY)
+    if snapshot is not None:
+        from prepare_data import citation_graph_from_csr
+        citation_graph = citation_graph_from_csr(snapshot.citation_csr)
+    else:
+        with open('citation_graph.json', 'r') as f:
+            citation_graph = json.load(f)
 
     # Create nodes
     case_ids = list(citation_graph.keys())